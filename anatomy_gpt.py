@@ -1,10 +1,14 @@
-import json
 import os
+import threading
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Tuple
 
+import orjson
 from openai import OpenAI
 
+from openai_client import get_client
+
 # Deterministic router (optional pre-filter) + validator + supported case gate
 try:
     from approach_router import get_allowed_and_blocked, validate_selected_approaches, get_supported_case
@@ -13,6 +17,31 @@ except Exception:
     validate_selected_approaches = None
     get_supported_case = None
 
+# Token-accurate summary truncation; falls back to char slicing if tiktoken
+# (or its encoding download) is unavailable.
+try:
+    import tiktoken
+
+    try:
+        _ENC = tiktoken.encoding_for_model("gpt-4.1-mini")
+    except KeyError:
+        _ENC = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _ENC = None
+
+SUMMARY_MAX_TOKENS = 80
+SUMMARY_MAX_CHARS = 280
+SELECTED_JSON_CACHE_SIZE = 256
+
+
+def _summary_for(text: str) -> str:
+    if _ENC is None:
+        return text[:SUMMARY_MAX_CHARS]
+    tokens = _ENC.encode(text)
+    if len(tokens) <= SUMMARY_MAX_TOKENS:
+        return text
+    return _ENC.decode(tokens[:SUMMARY_MAX_TOKENS])
+
 
 # -----------------------------
 # IO helpers
@@ -30,20 +59,16 @@ def load_catalog_from_jsonl_file(path: str) -> List[Dict[str, Any]]:
             if not line:
                 continue
             try:
-                items.append(json.loads(line))
-            except json.JSONDecodeError as e:
+                items.append(orjson.loads(line))
+            except orjson.JSONDecodeError as e:
                 raise ValueError(f"Invalid JSON on line {i} of {path}") from e
 
     return items
 
 
-def compact_catalog_for_prompt(catalog: List[Dict[str, Any]], max_chars: int = 12000) -> str:
-    """
-    Compact the approach catalog so you're not shipping huge payloads to the model.
-    Keep the fields most useful for selection and quiz generation.
-    """
+def _compact_rows(items: List[Dict[str, Any]], summaries: List[str]) -> List[Dict[str, Any]]:
     rows = []
-    for a in catalog:
+    for a, summary in zip(items, summaries):
         aliases = a.get("aliases") or []
         meta = a.get("meta") or {}
         rows.append(
@@ -54,17 +79,97 @@ def compact_catalog_for_prompt(catalog: List[Dict[str, Any]], max_chars: int = 1
                 "region": meta.get("region"),
                 "anatomic_area": meta.get("anatomic_area"),
                 "joint": meta.get("joint"),
-                "summary": (a.get("text", "") or "")[:280],
+                "summary": summary,
             }
         )
-    s = json.dumps(rows, ensure_ascii=False)
-    return s[:max_chars]
+    return rows
+
+
+@dataclass
+class Catalog:
+    """
+    Approach catalog indexed once per process.
+
+    Iterates/len()s like the raw list so existing callers keep working, but
+    lookups go through by_id / ids instead of rebuilding dicts per call.
+    """
+
+    items: List[Dict[str, Any]]
+    by_id: Dict[str, Dict[str, Any]] = field(init=False, repr=False)
+    ids: FrozenSet[str] = field(init=False, repr=False)
+    summaries: List[str] = field(init=False, repr=False)
+    compact_json: str = field(init=False, repr=False)
+    _selected: Dict[Tuple[str, ...], str] = field(init=False, repr=False, default_factory=dict)
+
+    def __post_init__(self) -> None:
+        self.by_id = {a["id"]: a for a in self.items if a.get("id")}
+        self.ids = frozenset(self.by_id)
+        # Tokenized once at load; kept off the items so build_quiz payloads stay clean.
+        self.summaries = [_summary_for(a.get("text", "") or "") for a in self.items]
+        # Built at load (startup), so Stage 1 only slices a ready string per request.
+        self.compact_json = orjson.dumps(_compact_rows(self.items, self.summaries)).decode()
+
+    @classmethod
+    def from_jsonl(cls, *paths: str) -> "Catalog":
+        items: List[Dict[str, Any]] = []
+        for path in paths:
+            items.extend(load_catalog_from_jsonl_file(path))
+        return cls(items)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.items)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def compact(self, max_chars: int = 12000) -> str:
+        return self.compact_json[:max_chars]
+
+    def selected_json(self, ids: Tuple[str, ...]) -> str:
+        """JSON for the given approach entries (in order), memoized per id tuple."""
+        s = self._selected.get(ids)
+        if s is None:
+            if len(self._selected) >= SELECTED_JSON_CACHE_SIZE:
+                self._selected.clear()
+            s = orjson.dumps([self.by_id[i] for i in ids if i in self.by_id]).decode()
+            self._selected[ids] = s
+        return s
+
+
+def compact_catalog_for_prompt(catalog: Catalog, max_chars: int = 12000) -> str:
+    """
+    Compact the approach catalog so you're not shipping huge payloads to the model.
+    Keep the fields most useful for selection and quiz generation.
+    """
+    return catalog.compact(max_chars)
 
 
 # -----------------------------
 # OpenAI JSON-schema helper
 # -----------------------------
 
+# id(schema) -> (schema, text.format payload). Schemas are module constants,
+# so the Responses API payload is built once per schema, not per call.
+_TEXT_FORMAT_CACHE: Dict[int, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+
+
+def _text_format_for(json_schema: Dict[str, Any]) -> Dict[str, Any]:
+    hit = _TEXT_FORMAT_CACHE.get(id(json_schema))
+    if hit is not None and hit[0] is json_schema:
+        return hit[1]
+
+    fmt = {
+        "format": {
+            "type": "json_schema",
+            "name": json_schema.get("name", "output"),
+            "schema": json_schema["schema"],
+            "strict": True,
+        }
+    }
+    _TEXT_FORMAT_CACHE[id(json_schema)] = (json_schema, fmt)
+    return fmt
+
+
 class OpenAIJson:
     """
     Small helper to enforce JSON schema using Structured Outputs via Responses API.
@@ -85,16 +190,9 @@ class OpenAIJson:
             model=self.model,
             instructions=instructions,
             input=[{"role": "user", "content": user_input}],
-            text={
-                "format": {
-                    "type": "json_schema",
-                    "name": json_schema.get("name", "output"),
-                    "schema": json_schema["schema"],
-                    "strict": True,
-                }
-            },
+            text=_text_format_for(json_schema),
         )
-        return json.loads(resp.output_text)
+        return orjson.loads(resp.output_text)
 
 
 # -----------------------------
@@ -133,7 +231,7 @@ def select_approaches(
     llm: OpenAIJson,
     *,
     case_prompt: str,
-    catalog: List[Dict[str, Any]],
+    catalog: Catalog,
     n_min: int = 1,
     n_max: int = 3,
     catalog_max_chars: int = 12000,
@@ -148,7 +246,7 @@ def select_approaches(
     is heavily constrained to only those IDs. GPT is not allowed to pick
     blocked ones. This prevents clinically wrong choices for obvious procedures.
     """
-    catalog_compact = compact_catalog_for_prompt(catalog, max_chars=catalog_max_chars)
+    catalog_compact = catalog.compact(catalog_max_chars)
 
     # Build constrained instructions if router data is present
     constraint_text = ""
@@ -187,8 +285,7 @@ def select_approaches(
     )
 
     # Safety filter: keep only IDs that exist in the full catalog
-    valid_ids = {a.get("id") for a in catalog if a.get("id")}
-    result["selected"] = [x for x in result.get("selected", []) if x.get("id") in valid_ids]
+    result["selected"] = [x for x in result.get("selected", []) if x.get("id") in catalog.ids]
 
     if not result["selected"]:
         return {"selected": [], "notes": "No valid approach IDs returned."}
@@ -233,7 +330,7 @@ def build_quiz(
     llm: OpenAIJson,
     *,
     selected_ids: List[str],
-    catalog: List[Dict[str, Any]],
+    catalog: Catalog,
     num_questions: int = 8,
     max_selected_chars: int = 12000,
 ) -> Dict[str, Any]:
@@ -243,8 +340,7 @@ def build_quiz(
       - Only ships the *selected* approach entries (not full catalog).
       - Truncates payload to a reasonable char limit.
     """
-    by_id = {a["id"]: a for a in catalog if "id" in a}
-    selected = [by_id[i] for i in selected_ids if i in by_id]
+    selected_json = catalog.selected_json(tuple(selected_ids))
 
     instructions = (
         "You are an orthopaedic anatomy tutor generating quiz questions.\n"
@@ -261,7 +357,6 @@ def build_quiz(
         "- Always set approach_id to one of the provided selected approach IDs.\n"
     )
 
-    selected_json = json.dumps(selected, ensure_ascii=False)
     user_input = (
         f"SELECTED APPROACHES (JSON):\n{selected_json[:max_selected_chars]}\n\n"
         f"Create ~{num_questions} questions total, spread across the approaches."
@@ -284,10 +379,14 @@ def build_quiz(
 # Orchestrator (Stages 1 + 2 only)
 # -----------------------------
 
+def _cancelled_result() -> Dict[str, Any]:
+    return {"approachSelection": {"selected": []}, "anatomyQuiz": {"questions": []}}
+
+
 def run_pipeline_fast(
     *,
     case_prompt: str,
-    catalog: List[Dict[str, Any]],
+    catalog: Catalog,
     model_selector: str = "gpt-4.1-mini",
     model_quiz: str = "gpt-4.1-mini",
     client: Optional[OpenAI] = None,
@@ -297,14 +396,18 @@ def run_pipeline_fast(
     num_questions: int = 8,
     catalog_max_chars: int = 12000,
     max_selected_chars: int = 12000,
+    cancel: Optional[threading.Event] = None,
 ) -> Dict[str, Any]:
     """
     Fast pipeline:
       1) approach selection
       2) anatomy quiz
     (Stage 3 removed.)
+
+    Setting `cancel` (caller no longer needs the result) skips any GPT stage
+    that hasn't started yet; a call already in flight still completes.
     """
-    client = client or OpenAI()
+    client = client or get_client()
 
     selector = OpenAIJson(client, model_selector)
     quizzer = OpenAIJson(client, model_quiz)
@@ -352,6 +455,9 @@ def run_pipeline_fast(
             "router": router_info,
         }
 
+    if cancel is not None and cancel.is_set():
+        return _cancelled_result()
+
     sel = select_approaches(
         selector,
         case_prompt=case_prompt,
@@ -376,9 +482,8 @@ def run_pipeline_fast(
         }
 
     # --- Safety validation (post-GPT) ---
-    valid_catalog_ids = {a.get("id") for a in catalog if a.get("id")}
     if validate_selected_approaches is not None:
-        validation = validate_selected_approaches(selected_ids, valid_catalog_ids, router_info)
+        validation = validate_selected_approaches(selected_ids, catalog.ids, router_info)
     else:
         # Guard: router/validator import was skipped (defensive try/except at module top).
         # Preserve selection; mark as unvalidated so downstream (hybrid) still gets approachSelection.
@@ -404,6 +509,9 @@ def run_pipeline_fast(
             "anatomyQuiz": {"questions": []},
         }
 
+    if cancel is not None and cancel.is_set():
+        return _cancelled_result()
+
     quiz = build_quiz(
         quizzer,
         selected_ids=selected_ids,
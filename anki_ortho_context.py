@@ -1,16 +1,20 @@
-import json
 import os
 import re
 import time
+from array import array
 from collections import Counter
+from functools import lru_cache
 from html import unescape
 from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
+import orjson
 from dotenv import load_dotenv
 from openai import OpenAI
-from pinecone import Pinecone
 from pydantic import BaseModel, Field
 
+from openai_http import get_http_client
+from pinecone_client import get_index
+
 
 load_dotenv()
 
@@ -75,6 +79,7 @@ def _get_openai_client() -> OpenAI:
             api_key=OPENAI_API_KEY,
             project=OPENAI_PROJECT_ID,
             timeout=30.0,
+            http_client=get_http_client(),
         )
     return _OPENAI_CLIENT
 
@@ -84,18 +89,36 @@ def _get_pinecone_index():
     if _PINECONE_INDEX is None:
         if not PINECONE_API_KEY or not PINECONE_INDEX_NAME:
             raise ValueError("Missing PINECONE_API_KEY or PINECONE_INDEX.")
-        pc = Pinecone(api_key=PINECONE_API_KEY)
-        _PINECONE_INDEX = pc.Index(PINECONE_INDEX_NAME)
+        _PINECONE_INDEX = get_index(PINECONE_INDEX_NAME)
     return _PINECONE_INDEX
 
 
+_HTML_TAG_RE = re.compile(r"<[^>]+>")
+_WS_RE = re.compile(r"\s+")
+_CODE_FENCE_RE = re.compile(r"`{3}.*?`{3}", re.S)
+_CLOZE_OPEN_RE = re.compile(r"\{\{c\d+::")
+_SOUND_TAG_RE = re.compile(r"\[sound:[^\]]+\]")
+_MD_HEADING_RE = re.compile(r"(?m)^\s*#{1,6}\s*")
+_MD_QUOTE_RE = re.compile(r"(?m)^\s*>+\s*")
+_MD_LEADING_MARK_RE = re.compile(r"(?m)^\s*[_*`~]+\s*")
+_MD_RUN_RE = re.compile(r"(?m)\s*[_*`~]{2,}\s*")
+_MD_MARK_BEFORE_WORD_RE = re.compile(r"(?m)\b[_*`~]+([A-Za-z])")
+_MD_MARK_AFTER_WORD_RE = re.compile(r"(?m)([A-Za-z])[_*`~]+\b")
+_EXTRA_NEWLINES_RE = re.compile(r"\n{3,}")
+_LINE_LEAD_MARKS_RE = re.compile(r"(?m)^[\s>*#]+")
+_BULLET_SEPARATOR_RE = re.compile(r"\s*(?:[•·▪◦●○Ð]+|\s[-–—]\s)\s*")
+_BULLET_CHAR_RE = re.compile(r"[•·▪◦●○Ð]")
+_DASH_SEPARATOR_RE = re.compile(r"\s[-–—]\s")
+_BULLET_LEAD_RE = re.compile(r"^[\s_*\-–—•·▪◦●○`~]+")
+
+
 def _strip_html(value: str) -> str:
-    no_tags = re.sub(r"<[^>]+>", " ", value or "")
+    no_tags = _HTML_TAG_RE.sub(" ", value or "")
     return unescape(no_tags)
 
 
 def _normalize_space(value: str) -> str:
-    return re.sub(r"\s+", " ", (value or "").strip())
+    return _WS_RE.sub(" ", (value or "").strip())
 
 
 def _fix_mojibake(value: str) -> str:
@@ -117,23 +140,23 @@ def _fix_mojibake(value: str) -> str:
 
 
 def _remove_markdown_artifacts(value: str) -> str:
-    value = re.sub(r"`{3}.*?`{3}", " ", value, flags=re.S)
-    value = re.sub(r"(?m)^\s*#{1,6}\s*", "", value)
-    value = re.sub(r"(?m)^\s*>+\s*", "", value)
-    value = re.sub(r"(?m)^\s*[_*`~]+\s*", "", value)
-    value = re.sub(r"(?m)\s*[_*`~]{2,}\s*", " ", value)
-    value = re.sub(r"(?m)\b[_*`~]+([A-Za-z])", r"\1", value)
-    value = re.sub(r"(?m)([A-Za-z])[_*`~]+\b", r"\1", value)
+    value = _CODE_FENCE_RE.sub(" ", value)
+    value = _MD_HEADING_RE.sub("", value)
+    value = _MD_QUOTE_RE.sub("", value)
+    value = _MD_LEADING_MARK_RE.sub("", value)
+    value = _MD_RUN_RE.sub(" ", value)
+    value = _MD_MARK_BEFORE_WORD_RE.sub(r"\1", value)
+    value = _MD_MARK_AFTER_WORD_RE.sub(r"\1", value)
     return value
 
 
 def _clean_text(value: str) -> str:
     value = _strip_html(value)
     value = _fix_mojibake(value)
-    value = re.sub(r"`{3}.*?`{3}", " ", value, flags=re.S)
-    value = re.sub(r"\{\{c\d+::", "", value)
+    value = _CODE_FENCE_RE.sub(" ", value)
+    value = _CLOZE_OPEN_RE.sub("", value)
     value = value.replace("}}", " ")
-    value = re.sub(r"\[sound:[^\]]+\]", " ", value)
+    value = _SOUND_TAG_RE.sub(" ", value)
     return _normalize_space(value)
 
 
@@ -142,20 +165,19 @@ def _clean_display_text(value: str) -> str:
     value = _fix_mojibake(value)
     value = value.replace("\r\n", "\n").replace("\r", "\n")
     value = _remove_markdown_artifacts(value)
-    value = re.sub(r"\{\{c\d+::", "", value)
+    value = _CLOZE_OPEN_RE.sub("", value)
     value = value.replace("}}", " ")
-    value = re.sub(r"\[sound:[^\]]+\]", " ", value)
-    value = re.sub(r"\n{3,}", "\n\n", value)
-    value = re.sub(r"(?m)^[\s>*#]+", "", value)
+    value = _SOUND_TAG_RE.sub(" ", value)
+    value = _EXTRA_NEWLINES_RE.sub("\n\n", value)
+    value = _LINE_LEAD_MARKS_RE.sub("", value)
 
-    separator_re = re.compile(r"\s*(?:[•·▪◦●○Ð]+|\s[-–—]\s)\s*")
-    bullet_like_count = len(re.findall(r"[•·▪◦●○Ð]", value)) + len(
-        re.findall(r"\s[-–—]\s", value)
+    bullet_like_count = len(_BULLET_CHAR_RE.findall(value)) + len(
+        _DASH_SEPARATOR_RE.findall(value)
     )
     if bullet_like_count >= 2 or value.lstrip().startswith(("•", "Ð", "-", "–", "—", "_")):
         parts = [
-            re.sub(r"\s+", " ", re.sub(r"^[\s_*\-–—•·▪◦●○`~]+", "", part)).strip(" ;,:")
-            for part in separator_re.split(value)
+            _WS_RE.sub(" ", _BULLET_LEAD_RE.sub("", part)).strip(" ;,:")
+            for part in _BULLET_SEPARATOR_RE.split(value)
         ]
         parts = [part for part in parts if part]
         if len(parts) >= 2:
@@ -163,8 +185,8 @@ def _clean_display_text(value: str) -> str:
 
     lines = []
     for raw_line in value.split("\n"):
-        line = re.sub(r"^[\s_*\-–—•·▪◦●○`~]+", "", raw_line)
-        line = re.sub(r"\s+", " ", line).strip(" ;,")
+        line = _BULLET_LEAD_RE.sub("", raw_line)
+        line = _WS_RE.sub(" ", line).strip(" ;,")
         if line:
             lines.append(line)
     if len(lines) >= 2:
@@ -255,7 +277,7 @@ def _cleanup_answers_with_gpt(items: List[Dict[str, str]]) -> List[str]:
                     "If an answer is a list, use concise bullet lines prefixed with '- '."
                 ),
             },
-            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
+            {"role": "user", "content": orjson.dumps(payload).decode()},
         ],
         response_format={
             "type": "json_schema",
@@ -283,7 +305,7 @@ def _cleanup_answers_with_gpt(items: List[Dict[str, str]]) -> List[str]:
         },
     )
     content = completion.choices[0].message.content or ""
-    parsed = json.loads(content)
+    parsed = orjson.loads(content)
     cleaned_items = parsed.get("items") if isinstance(parsed, dict) else None
     if not isinstance(cleaned_items, list):
         raise ValueError("Cleanup GPT returned invalid payload.")
@@ -527,9 +549,15 @@ def _primary_key_phrases(key_phrases: Set[str]) -> Set[str]:
     return {phrase for phrase in key_phrases if phrase not in generic}
 
 
-def _embed_text(text: str) -> List[float]:
+@lru_cache(maxsize=256)
+def _embed_cached(text: str) -> array:
+    # float32 storage: 6 KB per vector instead of ~50 KB as a tuple of Python floats
     client = _get_openai_client()
-    return client.embeddings.create(model=EMBED_MODEL, input=text).data[0].embedding
+    return array("f", client.embeddings.create(model=EMBED_MODEL, input=text).data[0].embedding)
+
+
+def _embed_text(text: str) -> List[float]:
+    return list(_embed_cached(text))
 
 
 def _build_source_filter() -> Dict[str, Any]:
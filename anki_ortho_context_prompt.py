@@ -1,6 +1,6 @@
-import json
 from typing import Any, Dict, List, Optional
 
+import orjson
 from openai import OpenAI
 
 
@@ -131,7 +131,7 @@ def _extract_tool_args(message: Any, tool_name: str) -> Dict[str, Any]:
         try:
             fn = tool_call.function
             if fn and fn.name == tool_name:
-                return json.loads(fn.arguments or "{}")
+                return orjson.loads(fn.arguments or "{}")
         except Exception:
             continue
     return {}
@@ -158,7 +158,7 @@ def format_fast_article_with_gpt(
         max_tokens=220,
         messages=[
             {"role": "system", "content": _fast_system_prompt()},
-            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
+            {"role": "user", "content": orjson.dumps(payload).decode()},
         ],
         tools=_card_level_tool_schema(),
         tool_choice={"type": "function", "function": {"name": "emit_anki_card_level"}},
@@ -201,7 +201,7 @@ def format_enhanced_anki_ortho_context_with_gpt(
         max_tokens=520,
         messages=[
             {"role": "system", "content": _enhanced_system_prompt()},
-            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
+            {"role": "user", "content": orjson.dumps(payload).decode()},
         ],
         tools=_card_level_tool_schema(),
         tool_choice={"type": "function", "function": {"name": "emit_anki_card_level"}},
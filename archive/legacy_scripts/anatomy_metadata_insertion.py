@@ -79,12 +79,12 @@ def add_muscles_from_excel(
         alias_map = metadata.get("bone_aliases", {})
         any_aliases = False
 
-        for _, row in df.iterrows():
-            slug = str(row[value_col]).strip()
+        for slug_cell, alias_cell in zip(df[value_col], df[aliases_col]):
+            slug = str(slug_cell).strip()
             if not slug or _is_section_header(slug):
                 continue
 
-            aliases = _split_aliases(row.get(aliases_col))
+            aliases = _split_aliases(alias_cell)
             if not aliases:
                 continue
 
@@ -0,0 +1,58 @@
+"""
+Single-pass keyword tagging for the Anki reformat scripts.
+
+build_keyword_matcher compiles every keyword list into one Aho-Corasick
+automaton (pip install pyahocorasick), so each card is scanned once no matter
+how many keywords there are. Without the package it falls back to the plain
+substring scan. Either way each kind resolves to its earliest keyword in list
+order, matching the old per-list find_match.
+"""
+
+from typing import Callable, Dict, List
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+def build_keyword_matcher(**keyword_lists: List[str]) -> Callable[[str], Dict[str, str]]:
+    """
+    build_keyword_matcher(procedure=[...], diagnosis=[...]) returns
+    match(lower_text) -> {"procedure": "...", "diagnosis": "..."} ("" when absent).
+    The text must already be lowercased.
+    """
+    kinds = list(keyword_lists)
+
+    if ahocorasick is None:
+        lowered = {kind: [k.lower() for k in kws] for kind, kws in keyword_lists.items()}
+
+        def match(lower: str) -> Dict[str, str]:
+            out = {}
+            for kind in kinds:
+                out[kind] = next(
+                    (orig for orig, key in zip(keyword_lists[kind], lowered[kind]) if key in lower), ""
+                )
+            return out
+
+        return match
+
+    automaton = ahocorasick.Automaton()
+    for kind, kws in keyword_lists.items():
+        for idx, kw in enumerate(kws):
+            key = kw.lower()
+            # One automaton entry per word; several kinds/indices can share it
+            hits = automaton.get(key, [])
+            hits.append((kind, idx))
+            automaton.add_word(key, hits)
+    automaton.make_automaton()
+
+    def match(lower: str) -> Dict[str, str]:
+        best: Dict[str, int] = {}
+        for _, hits in automaton.iter(lower):
+            for kind, idx in hits:
+                if idx < best.get(kind, len(keyword_lists[kind])):
+                    best[kind] = idx
+        return {kind: keyword_lists[kind][best[kind]] if kind in best else "" for kind in kinds}
+
+    return match
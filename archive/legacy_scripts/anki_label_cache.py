@@ -0,0 +1,63 @@
+"""
+Persistent (specialty, region) cache for the Anki reformat scripts.
+
+Decks overlap heavily and reruns resume over the same input, so each card's
+GPT labels are stored in SQLite keyed by a hash of the labelling rubric plus
+the whitespace/case-normalized card text. Editing a rubric changes every key,
+so stale labels are never served.
+"""
+
+import hashlib
+import os
+import sqlite3
+from typing import Awaitable, Callable, Optional, Tuple
+
+LABEL_CACHE_PATH = os.getenv("ANKI_LABEL_CACHE_PATH", "anki_label_cache.sqlite")
+
+_db: Optional[sqlite3.Connection] = None
+
+
+def _get_db() -> sqlite3.Connection:
+    global _db
+    if _db is None:
+        db = sqlite3.connect(LABEL_CACHE_PATH)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS labels "
+            "(hash BLOB PRIMARY KEY, specialty TEXT NOT NULL, region TEXT NOT NULL)"
+        )
+        _db = db
+    return _db
+
+
+def label_key(rubric: str, card_text: str) -> bytes:
+    norm = " ".join(card_text.lower().split())
+    return hashlib.sha256(f"{rubric}\x00{norm}".encode("utf-8")).digest()
+
+
+def get_labels(key: bytes) -> Optional[Tuple[str, str]]:
+    row = _get_db().execute("SELECT specialty, region FROM labels WHERE hash = ?", (key,)).fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def put_labels(key: bytes, specialty: str, region: str) -> None:
+    # Empty labels usually mean the call failed; leave those uncached so a rerun retries them
+    if not (specialty or region):
+        return
+    db = _get_db()
+    db.execute("INSERT OR REPLACE INTO labels VALUES (?, ?, ?)", (key, specialty, region))
+    db.commit()
+
+
+async def acached_assign(
+    rubric: str, card_text: str, assign: Callable[[], Awaitable[Tuple[str, str]]]
+) -> Tuple[str, str]:
+    """Return cached labels for the card, else await assign() and store its result."""
+    key = label_key(rubric, card_text)
+    hit = get_labels(key)
+    if hit is not None:
+        return hit
+    specialty, region = await assign()
+    put_labels(key, specialty, region)
+    return specialty, region
@@ -1,18 +1,32 @@
 import os
-import json
+import sys
 import re
-import time
+import asyncio
+import hashlib
+import orjson
+from difflib import get_close_matches
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI, RateLimitError
+
+from anki_keywords import build_keyword_matcher
+from anki_label_cache import acached_assign, get_labels, label_key, put_labels
+
+# Shared helpers live at the repo root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from openai_batch import run_chat_batch  # noqa: E402
+from openai_utils import retry_delay  # noqa: E402
 
 # ── Load environment
 load_dotenv()
 
 # ── Initialize OpenAI client
-client = OpenAI()
+aclient = AsyncOpenAI()
 
-# ── GPT rate limit (approx 60 calls/minute)
-GPT_SLEEP_SECONDS = 1.1
+# ── GPT concurrency (replaces the old fixed 1.1s sleep per call)
+GPT_CONCURRENCY = 10   # in-flight chat requests
+GPT_MAX_RETRIES = 6    # per request, on 429s
+CHUNK_SIZE = 32        # facts labelled concurrently before writing
+BATCH_MODE = "--batch" in sys.argv[1:]  # label cache misses through the Batch API first (half price, slow)
 
 
 # ── File paths
@@ -88,8 +102,8 @@ region_list = [
     "Lisfranc", "Midfoot", "Metatarsal", "PhalangesFoot", "Toe", "MTPJoint", "IPJointFoot", "SubtalarJoint",
 ]
 
-procedure_keywords_lower = [p.lower() for p in procedure_keywords]
-diagnosis_keywords_lower = [d.lower() for d in diagnosis_keywords]
+# One pass per card over both keyword lists
+match_keywords = build_keyword_matcher(procedure=procedure_keywords, diagnosis=diagnosis_keywords)
 
 image_keywords = [
     "image", "shown", "depicted", "seen here", "figure", "mri", "radiograph", "x-ray",
@@ -97,74 +111,104 @@ image_keywords = [
     "in the diagram", "on the diagram", "in the figure", "red arrow", "coronal", "axial", "sagittal"
 ]
 
-def gpt_assign_specialty(q, a):
-    prompt = f"""You are a senior orthopaedic attending. Assign one and only one subspecialty from this list: 
-["Trauma", "Sports", "Recon", "Hand", "Peds", "Spine", "Onc", "FootAnkle", "ShoulderElbow"].
+# Fixed instructions go first and byte-identical on every call (eligible for
+# OpenAI's automatic prefix cache); only the card text varies, in the user turn.
+METADATA_SYSTEM_PROMPT = """You are a senior orthopaedic attending. Based on the flashcard you are given, assign:
 
-Q: {q}
-A: {a}
+"specialty": one and only one subspecialty from this list: 
+["Trauma", "Sports", "Recon", "Hand", "Peds", "Spine", "Onc", "FootAnkle", "ShoulderElbow"].
 
-Return just the subspecialty."""
-    
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0
+"region": the most appropriate anatomical region, even if it's not in a predefined list. Be concise (1–3 words max).
+
+Return a JSON object with exactly the keys "specialty" and "region"."""
+
+def metadata_request(q, a):
+    """Chat-completion kwargs for one card; shared by the live and Batch API paths."""
+    return dict(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": METADATA_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Q: {q}\nA: {a}"},
+        ],
+        temperature=0,
+        response_format={"type": "json_object"},
+        extra_body={"prompt_cache_key": "anki-facts-metadata-v1"},
     )
-    time.sleep(GPT_SLEEP_SECONDS)
-    return response.choices[0].message.content.strip()
-
-def gpt_assign_region(q, a):
-    prompt = f"""You are an orthopaedic surgeon. Based on the following flashcard, assign the most appropriate anatomical region.
 
-Return only the best-fit anatomical region, even if it's not in a predefined list. Be concise (1–3 words max).
+def parse_metadata(content):
+    result = orjson.loads(content)
 
-Q: {q}
-A: {a}
-"""
+    specialty = str(result.get("specialty") or "").strip()
+    region = str(result.get("region") or "").strip()
+    if specialty not in specialty_list:
+        match = get_close_matches(specialty, specialty_list, n=1)
+        specialty = match[0] if match else ""
+    return specialty, region
 
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0
-    )
-    time.sleep(GPT_SLEEP_SECONDS)
-    return response.choices[0].message.content.strip()
+async def gpt_complete(sem, request):
+    for attempt in range(GPT_MAX_RETRIES):
+        try:
+            async with sem:
+                response = await aclient.chat.completions.create(**request)
+            return response.choices[0].message.content.strip()
+        except RateLimitError as e:
+            if attempt == GPT_MAX_RETRIES - 1:
+                raise
+            # Sleep outside the semaphore so other requests keep the slot busy
+            await asyncio.sleep(retry_delay(e, attempt))
+
+async def gpt_assign_metadata(sem, q, a):
+    """Specialty + region for one card in a single JSON-mode call."""
+    return parse_metadata(await gpt_complete(sem, metadata_request(q, a)))
+
+def batch_prewarm_labels(facts):
+    """Label every uncached fact through the Batch API and store the results in the label cache."""
+    bodies = {}
+    for fact in facts:
+        key = label_key(METADATA_SYSTEM_PROMPT, fact)
+        if get_labels(key) is None:
+            bodies[key.hex()] = metadata_request(fact, "")  # Blank answer
+    print(f"📦 {len(facts) - len(bodies):,} facts already labelled; batching {len(bodies):,}")
+
+    for custom_id, content in run_chat_batch(OpenAI(), bodies, name="anki_facts_labels").items():
+        try:
+            put_labels(bytes.fromhex(custom_id), *parse_metadata(content))
+        except Exception as e:
+            print(f"⚠️ Unparseable batch result {custom_id}: {e}")
 
 
 # ── Utilities
+_CLOZE = re.compile(r"\{\{c\d+::(.*?)\}\}")
+_UNCLOSED_CLOZE = re.compile(r"\{\{[^}]*$")
+# Substring semantics of the old any(keyword in text ...) scan, in one C-level search
+_IMAGE_RE = re.compile("|".join(map(re.escape, image_keywords)))
+
 def clean_field(text):
-    return re.sub(r"\{\{c\d+::(.*?)\}\}", r"\1", text).strip() if text else ""
+    return _CLOZE.sub(r"\1", text).strip() if text else ""
 
 def extract_metadata_from_tags(tags):
     specialty = next((s for s in specialty_list if s in tags), "")
     region = next((r for r in region_list if r in tags), "")
     return specialty, region
 
-def find_match(text, keywords_lower, keywords_original):
-    lower = text.lower()
-    for i, key in enumerate(keywords_lower):
-        if key in lower:
-            return keywords_original[i]
-    return ""
+# ── Deduplication (16-byte digests instead of full fact strings)
+def fact_key(fact):
+    return hashlib.blake2b(fact.encode("utf-8"), digest_size=16).digest()
 
-# ── Deduplication
 processed_facts = set()
 if os.path.exists(output_path):
-    with open(output_path, "r") as f:
+    with open(output_path, "rb") as f:
         for line in f:
             try:
-                data = json.loads(line)
-                processed_facts.add(data.get("fact", "").strip())
-            except json.JSONDecodeError:
+                data = orjson.loads(line)
+                processed_facts.add(fact_key(data.get("fact", "").strip()))
+            except orjson.JSONDecodeError:
                 continue
 
 
 # ── Main loop
-with open(input_path, "r") as infile, \
-     open(output_path, "a") as outfile, \
-     open(rejected_log_path, "a") as rejected_log:
-
+def pending_facts(infile, rejected_log):
+    """Yield (line_no, lowercased text, fact) for every card that passes the filters and still needs metadata."""
     for i, line in enumerate(infile, 1):
 
         parts = line.strip().split("\t")
@@ -175,7 +219,7 @@ with open(input_path, "r") as infile, \
         raw_text = parts[0]
 
         # ❌ Unclosed cloze
-        if re.search(r"\{\{[^}]*$", raw_text):
+        if _UNCLOSED_CLOZE.search(raw_text):
             print("❌ Rejected (unclosed cloze)")
             rejected_log.write(f"[Line {i}] ❌ Unclosed cloze: {raw_text}\n")
             continue
@@ -189,33 +233,45 @@ with open(input_path, "r") as infile, \
             continue
 
         # ❌ Skip visual/image-based facts
-        if any(keyword in cleaned.lower() for keyword in image_keywords):
+        lower = cleaned.lower()
+        if _IMAGE_RE.search(lower):
             print("❌ Rejected (image keyword found)")
             rejected_log.write(f"[Line {i}] 🖼️ Skipped image-based fact: {cleaned}\n")
             continue
 
         fact = f"Fact: {cleaned}"
-        if fact in processed_facts:
+        key = fact_key(fact)
+        if key in processed_facts:
             print("⏩ Skipped (already processed)")
             continue
 
-        # 🧠 Force GPT to assign metadata
-        try:
-            specialty = gpt_assign_specialty(fact, "")  # Blank answer
-        except Exception as e:
-            print(f"❌ GPT specialty error: {e}")
-            rejected_log.write(f"[Line {i}] ❌ GPT specialty error: {e} | Fact: {fact}\n")
-            specialty = ""
+        # Mark now so a repeat later in the same chunk is skipped too
+        processed_facts.add(key)
+        yield i, lower, fact
+
+async def label_chunk(sem, chunk):
+    """(specialty, region) or the exception for every fact in the chunk, all requests in flight together."""
+    return await asyncio.gather(
+        *[
+            # Cards labelled on an earlier run (or in another deck) skip GPT
+            acached_assign(METADATA_SYSTEM_PROMPT, fact, lambda fact=fact: gpt_assign_metadata(sem, fact, ""))  # Blank answer
+            for _, _, fact in chunk
+        ],
+        return_exceptions=True,
+    )
 
-        try:
-            region = gpt_assign_region(fact, "")  # Blank answer
-        except Exception as e:
-            print(f"❌ GPT region error: {e}")
-            rejected_log.write(f"[Line {i}] ❌ GPT region error: {e} | Fact: {fact}\n")
-            region = ""
+def write_chunk(chunk, labels, outfile, rejected_log):
+    for (i, lower, fact), labelled in zip(chunk, labels):
+        if isinstance(labelled, BaseException):
+            print(f"❌ GPT metadata error: {labelled}")
+            rejected_log.write(f"[Line {i}] ❌ GPT metadata error: {labelled} | Fact: {fact}\n")
+            specialty, region = "", ""
+        else:
+            specialty, region = labelled
 
-        procedure = find_match(cleaned, procedure_keywords_lower, procedure_keywords)
-        diagnosis = find_match(cleaned, diagnosis_keywords_lower, diagnosis_keywords)
+        matches = match_keywords(lower)
+        procedure = matches["procedure"]
+        diagnosis = matches["diagnosis"]
 
         card = {
             "fact": fact,
@@ -228,9 +284,34 @@ with open(input_path, "r") as infile, \
             }
         }
 
-        outfile.write(json.dumps(card) + "\n")
-        processed_facts.add(fact)
+        outfile.write(orjson.dumps(card) + b"\n")
         print(f"✅ Saved: {fact}")
 
-        if len(processed_facts) % 10 == 0:
-            print(f"📈 Total processed: {len(processed_facts)}")
\ No newline at end of file
+async def main():
+    sem = asyncio.Semaphore(GPT_CONCURRENCY)
+
+    with open(input_path, "r") as infile, \
+         open(output_path, "ab", buffering=1 << 20) as outfile, \
+         open(rejected_log_path, "a") as rejected_log:
+
+        items = pending_facts(infile, rejected_log)
+        if BATCH_MODE:
+            # The loop below then reads batch labels from the cache and labels any leftovers live
+            items = list(items)
+            batch_prewarm_labels([fact for _, _, fact in items])
+
+        # 🧠 Force GPT to assign metadata, CHUNK_SIZE facts at a time
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= CHUNK_SIZE:
+                write_chunk(chunk, await label_chunk(sem, chunk), outfile, rejected_log)
+                outfile.flush()  # one write per chunk; a crash loses at most the chunk in flight
+                print(f"📈 Total processed: {len(processed_facts)}")
+                chunk = []
+
+        if chunk:
+            write_chunk(chunk, await label_chunk(sem, chunk), outfile, rejected_log)
+            print(f"📈 Total processed: {len(processed_facts)}")
+
+asyncio.run(main())
@@ -1,27 +1,49 @@
 import os
-import json
+import sys
 import re
+import asyncio
+import hashlib
+import orjson
+from difflib import get_close_matches
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI, RateLimitError
+
+from anki_keywords import build_keyword_matcher
+from anki_label_cache import acached_assign, get_labels, label_key, put_labels
+
+# Shared helpers live at the repo root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from openai_batch import run_chat_batch  # noqa: E402
+from openai_utils import retry_delay  # noqa: E402
 
 # ── Load OpenAI credentials ─────────────────────────────────
 load_dotenv()
-client = OpenAI()
+aclient = AsyncOpenAI()
+
+# ── GPT concurrency ─────────────────────────────────────────
+GPT_CONCURRENCY = 10   # in-flight chat requests
+GPT_MAX_RETRIES = 6    # per request, on 429s
+CHUNK_SIZE = 32        # cards processed concurrently before writing
+BATCH_MODE = "--batch" in sys.argv[1:]  # label cache misses through the Batch API first (half price, slow)
 
 input_path = "embed_millers.txt"
 output_path = "output_flashcards_millers.jsonl"
 log_path = "rejected_cards.log"
 
 # ── Step 1: Load previously processed questions ─────────────
+# 16-byte digests instead of full question strings
+def question_key(question):
+    return hashlib.blake2b(question.encode("utf-8"), digest_size=16).digest()
+
 seen_questions = set()
 if os.path.exists(output_path):
-    with open(output_path, 'r', encoding='utf-8') as existing:
+    with open(output_path, 'rb') as existing:
         for line in existing:
             try:
-                card = json.loads(line)
+                card = orjson.loads(line)
                 q = card.get("question", "").strip()
                 if q:
-                    seen_questions.add(q)
+                    seen_questions.add(question_key(q))
             except:
                 continue
 print(f"🔁 Resuming: {len(seen_questions):,} flashcards already processed.")
@@ -54,8 +76,8 @@ diagnosis_keywords = [  # Expanded list from prior message
     "PCL Tear", "Meniscal Root Tear", "OCD", "Achilles Rupture", "Hallux Valgus",
     "Morton’s Neuroma", "Plantar Fasciitis", "Tarsal Coalition", "Trigger Finger"
 ]
-procedure_keywords_lower = [p.lower() for p in procedure_keywords]
-diagnosis_keywords_lower = [d.lower() for d in diagnosis_keywords]
+# One pass per card over both keyword lists
+match_keywords = build_keyword_matcher(procedure=procedure_keywords, diagnosis=diagnosis_keywords)
 
 region_list = [
     # Upper Extremity
@@ -100,60 +122,80 @@ specialty_list = [
 ]
 
 # ── GPT Helpers ─────────────────────────────────────────────
-def gpt_assign_specialty(question, answer):
-    prompt = f"""
-You are a senior orthopaedic attending. Assign the **closest matching subspecialty** from the list below based on the following flashcard content. Return only one subspecialty exactly as written in the list.
+# Fixed instructions go first and byte-identical on every call (eligible for
+# OpenAI's automatic prefix cache); only the flashcard varies, in the user turn.
+METADATA_SYSTEM_PROMPT = f"""
+You are a senior orthopaedic attending. Based on the flashcard you are given, assign:
 
-Subspecialty list:
+"specialty": the **closest matching subspecialty** from this list, exactly as written:
 {', '.join(specialty_list)}
 
-Flashcard:
-Q: {question}
-A: {answer}
-
-Return only the closest matching subspecialty from the list above. Do not add extra text.
-"""
-    try:
-        resp = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0
-        )
-        result = resp.choices[0].message.content.strip()
-        if result not in specialty_list:
-            from difflib import get_close_matches
-            match = get_close_matches(result, specialty_list, n=1)
-            return match[0] if match else ""
-        return result
-    except Exception as e:
-        print(f"❌ GPT Specialty Error: {e}")
-        return ""
-
-def gpt_assign_region(question, answer):
-    prompt = f"""
-You are an orthopaedic attending. Based on the following flashcard, choose the **most appropriate anatomical region** related to the content.
-
-You must try to select from this list:
+"region": the **most appropriate anatomical region** related to the content. You must try to select from this list:
 {', '.join(region_list)}
-
-If none of these apply, generate a brief new region label (1-3 words max) that best describes the anatomical focus. Return only the region name with no extra text.
-
-Flashcard:
-Q: {question}
-A: {answer}
-"""
+If none of these apply, generate a brief new region label (1-3 words max) that best describes the anatomical focus.
+
+Return a JSON object with exactly the keys "specialty" and "region".
+""".strip()
+
+async def gpt_create(sem, **kwargs):
+    for attempt in range(GPT_MAX_RETRIES):
+        try:
+            async with sem:
+                return await aclient.chat.completions.create(**kwargs)
+        except RateLimitError as e:
+            if attempt == GPT_MAX_RETRIES - 1:
+                raise
+            # Sleep outside the semaphore so other requests keep the slot busy
+            await asyncio.sleep(retry_delay(e, attempt))
+
+def metadata_request(question, answer):
+    """Chat-completion kwargs for one card; shared by the live and Batch API paths."""
+    return dict(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": METADATA_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Flashcard:\nQ: {question}\nA: {answer}"},
+        ],
+        temperature=0,
+        response_format={"type": "json_object"},
+        extra_body={"prompt_cache_key": "anki-millers-metadata-v1"},
+    )
+
+def parse_metadata(content):
+    result = orjson.loads(content)
+
+    specialty = str(result.get("specialty") or "").strip()
+    region = str(result.get("region") or "").strip()
+    if specialty not in specialty_list:
+        match = get_close_matches(specialty, specialty_list, n=1)
+        specialty = match[0] if match else ""
+    return specialty, region
+
+async def gpt_assign_metadata(sem, question, answer):
+    """Specialty + region in one JSON-mode call; returns ("", "") on failure."""
     try:
-        resp = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3
-        )
-        return resp.choices[0].message.content.strip()
+        resp = await gpt_create(sem, **metadata_request(question, answer))
+        return parse_metadata(resp.choices[0].message.content)
     except Exception as e:
-        print(f"❌ GPT Region Error: {e}")
-        return ""
-
-def gpt_rewrite_flashcard(raw_line):
+        print(f"❌ GPT Metadata Error: {e}")
+        return "", ""
+
+def batch_prewarm_labels(cards):
+    """Label every uncached (question, answer) through the Batch API and store the results in the label cache."""
+    bodies = {}
+    for question, answer in cards:
+        key = label_key(METADATA_SYSTEM_PROMPT, f"{question}\n{answer}")
+        if get_labels(key) is None:
+            bodies[key.hex()] = metadata_request(question, answer)
+    print(f"📦 {len(cards) - len(bodies):,} cards already labelled; batching {len(bodies):,}")
+
+    for custom_id, content in run_chat_batch(OpenAI(), bodies, name="anki_millers_labels").items():
+        try:
+            put_labels(bytes.fromhex(custom_id), *parse_metadata(content))
+        except Exception as e:
+            print(f"⚠️ Unparseable batch result {custom_id}: {e}")
+
+async def gpt_rewrite_flashcard(sem, raw_line):
     prompt = f"""
 You are a senior orthopaedic attending educator. Reformat the following flashcard into a clean, high-yield Q&A format.
 
@@ -165,8 +207,9 @@ Q: ...
 A: ...
 """
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
+        response = await gpt_create(
+            sem,
+            model="gpt-4o-mini",
             messages=[{"role": "user", "content": prompt}],
             temperature=0,
         )
@@ -179,19 +222,9 @@ A: ...
         print(f"❌ GPT rewrite error: {e}")
     return None, None
 
-# ── Matching helper ─────────────────────────────────────────
-def find_match(text, keywords_lower, keywords_original):
-    lower = text.lower()
-    for i, key in enumerate(keywords_lower):
-        if key in lower:
-            return keywords_original[i]
-    return ""
-
 # ── Main Loop ───────────────────────────────────────────────
-with open(input_path, 'r', encoding='utf-8') as infile, \
-     open(output_path, 'a', encoding='utf-8') as outfile, \
-     open(log_path, 'a', encoding='utf-8') as log:
-
+def pending_cards(infile, log):
+    """Yield (line_no, line, question, answer) for every well-formed, unseen line."""
     for i, line in enumerate(infile, 1):
         parts = line.strip().split("\t")
         if len(parts) < 2:
@@ -202,55 +235,100 @@ with open(input_path, 'r', encoding='utf-8') as infile, \
         question = parts[0].strip()
         answer = parts[1].strip()
 
-        if question in seen_questions:
+        key = question_key(question)
+        if key in seen_questions:
             continue  # skip duplicate
 
-        if not question or not answer or len(question) < 10 or not question.endswith("?"):
-            print(f"⚠️ Invalid Q/A on line {i}, trying GPT fix...")
-            try:
-                fixed = client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": "You are an orthopaedic educator. Reformat this malformed flashcard into a useful Q&A pair."},
-                        {"role": "user", "content": f"Input:\n{line.strip()}\n\nReturn JSON with keys: question, answer."}
-                    ],
-                    temperature=0
-                )
-                json_result = json.loads(fixed.choices[0].message.content)
-                question = json_result["question"].strip()
-                answer = json_result["answer"].strip()
-                if question in seen_questions:
-                    continue  # prevent duplicates after GPT fix
-            except Exception as e:
-                print(f"❌ GPT failed to fix line {i}: {e}")
-                log.write(f"{i}: GPT failed to fix → {line.strip()}\n")
-                continue
-
-        # Find keywords
-        full_text = f"{question} {answer}"
-        diagnosis = find_match(full_text, diagnosis_keywords_lower, diagnosis_keywords)
-        procedure = find_match(full_text, procedure_keywords_lower, procedure_keywords)
-
-        # Assign GPT-based metadata
-        specialty = gpt_assign_specialty(question, answer)
-        region = gpt_assign_region(question, answer)
-
-        card = {
-            "question": question,
-            "answer": answer,
-            "additional_info": "",
-            "metadata": {
-                "specialty": specialty,
-                "region": region,
-                "diagnosis": diagnosis,
-                "procedure": procedure
-            }
+        # Mark now so a repeat later in the same chunk is skipped too
+        seen_questions.add(key)
+        yield i, line, question, answer
+
+def needs_fix(question, answer):
+    return not question or not answer or len(question) < 10 or not question.endswith("?")
+
+async def process_card(sem, i, line, question, answer, log):
+    """Fix the card if needed, then label it; returns the output card or None."""
+    if needs_fix(question, answer):
+        print(f"⚠️ Invalid Q/A on line {i}, trying GPT fix...")
+        try:
+            fixed = await gpt_create(
+                sem,
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": "You are an orthopaedic educator. Reformat this malformed flashcard into a useful Q&A pair."},
+                    {"role": "user", "content": f"Input:\n{line.strip()}\n\nReturn JSON with keys: question, answer."}
+                ],
+                temperature=0,
+                response_format={"type": "json_object"},
+            )
+            json_result = orjson.loads(fixed.choices[0].message.content)
+            question = json_result["question"].strip()
+            answer = json_result["answer"].strip()
+        except Exception as e:
+            print(f"❌ GPT failed to fix line {i}: {e}")
+            log.write(f"{i}: GPT failed to fix → {line.strip()}\n")
+            return None
+
+        key = question_key(question)
+        if key in seen_questions:
+            return None  # prevent duplicates after GPT fix
+        seen_questions.add(key)
+
+    # Find keywords
+    full_text = f"{question} {answer}"
+    matches = match_keywords(full_text.lower())
+    diagnosis = matches["diagnosis"]
+    procedure = matches["procedure"]
+
+    # Assign GPT-based metadata
+    # Cards labelled on an earlier run (or in another deck) skip GPT
+    specialty, region = await acached_assign(
+        METADATA_SYSTEM_PROMPT, f"{question}\n{answer}", lambda: gpt_assign_metadata(sem, question, answer)
+    )
+
+    return {
+        "question": question,
+        "answer": answer,
+        "additional_info": "",
+        "metadata": {
+            "specialty": specialty,
+            "region": region,
+            "diagnosis": diagnosis,
+            "procedure": procedure
         }
-
-        outfile.write(json.dumps(card) + "\n")
-        seen_questions.add(question)
-
-        if i % 10 == 0:
-            print(f"✅ Processed {i} lines")
-
+    }
+
+async def process_chunk(sem, chunk, outfile, log):
+    # Every card in the chunk is in flight together; output keeps input order
+    cards = await asyncio.gather(*[process_card(sem, *item, log) for item in chunk])
+    for card in cards:
+        if card is not None:
+            outfile.write(orjson.dumps(card) + b"\n")
+    outfile.flush()
+    print(f"✅ Processed {chunk[-1][0]} lines")
+
+async def main():
+    sem = asyncio.Semaphore(GPT_CONCURRENCY)
+
+    with open(input_path, 'r', encoding='utf-8') as infile, \
+         open(output_path, 'ab', buffering=1 << 20) as outfile, \
+         open(log_path, 'a', encoding='utf-8') as log:
+
+        items = pending_cards(infile, log)
+        if BATCH_MODE:
+            # Cards that need a GPT fix first only get their final Q/A live, so they stay on the live path
+            items = list(items)
+            batch_prewarm_labels([(q, a) for _, _, q, a in items if not needs_fix(q, a)])
+
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= CHUNK_SIZE:
+                await process_chunk(sem, chunk, outfile, log)
+                chunk = []
+
+        if chunk:
+            await process_chunk(sem, chunk, outfile, log)
+
+asyncio.run(main())
 print("🏁 Script complete – new cards added to output.")
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Unit tests for archive/legacy_scripts/anki_keywords.build_keyword_matcher.
+
+Runs every case against the plain substring fallback, the automaton path
+(driven by a small in-test Automaton double so it runs without
+pyahocorasick) and, when installed, the real pyahocorasick; all must agree.
+
+Run: python3 archive/legacy_scripts/test_anki_keywords.py
+"""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import anki_keywords  # noqa: E402
+from anki_keywords import build_keyword_matcher  # noqa: E402
+
+PROCEDURES = ["ORIF", "Arthroplasty", "Total Hip Arthroplasty", "ACL reconstruction"]
+DIAGNOSES = ["Fracture", "Hip fracture", "ACL tear", "Osteoarthritis"]
+
+# (lowercased card text, expected procedure, expected diagnosis)
+CASES = [
+    ("orif of a hip fracture", "ORIF", "Fracture"),
+    ("total hip arthroplasty for osteoarthritis", "Arthroplasty", "Osteoarthritis"),
+    ("acl tear treated with acl reconstruction", "ACL reconstruction", "ACL tear"),
+    ("no keywords here", "", ""),
+    ("", "", ""),
+]
+
+
+def _ok(name: str, cond: bool, detail: str = "") -> bool:
+    if cond:
+        print(f"PASS: {name}")
+        return True
+    print(f"FAIL: {name} {detail}")
+    return False
+
+
+class _Automaton:
+    """Brute-force stand-in for ahocorasick.Automaton (get/add_word/make_automaton/iter)."""
+
+    def __init__(self):
+        self._words = {}
+
+    def get(self, key, default=None):
+        return self._words.get(key, default)
+
+    def add_word(self, key, value):
+        self._words[key] = value
+
+    def make_automaton(self):
+        pass
+
+    def iter(self, text):
+        # (end_index, value) for every occurrence, in end-index order like pyahocorasick
+        hits = []
+        for key, value in self._words.items():
+            start = text.find(key)
+            while start != -1:
+                hits.append((start + len(key) - 1, value))
+                start = text.find(key, start + 1)
+        return iter(sorted(hits, key=lambda h: h[0]))
+
+
+_FAKE_AHOCORASICK = SimpleNamespace(Automaton=_Automaton)
+
+
+def _matchers(**keyword_lists):
+    """(label, matcher) for the fallback, the automaton path and, if installed, pyahocorasick."""
+    with patch.object(anki_keywords, "ahocorasick", None):
+        yield "fallback", build_keyword_matcher(**keyword_lists)
+    with patch.object(anki_keywords, "ahocorasick", _FAKE_AHOCORASICK):
+        yield "automaton", build_keyword_matcher(**keyword_lists)
+    if anki_keywords.ahocorasick is not None:
+        yield "ahocorasick", build_keyword_matcher(**keyword_lists)
+    else:
+        print("SKIP: pyahocorasick not installed; real automaton not exercised")
+
+
+def test_earliest_keyword_in_list_order() -> bool:
+    ok = True
+    for label, match in _matchers(procedure=PROCEDURES, diagnosis=DIAGNOSES):
+        for text, proc, dx in CASES:
+            got = match(text)
+            ok &= _ok(f"[{label}] {text!r}", got == {"procedure": proc, "diagnosis": dx}, str(got))
+    return ok
+
+
+def test_keyword_shared_across_kinds() -> bool:
+    ok = True
+    for label, match in _matchers(a=["Shared", "x"], b=["y", "shared"]):
+        got = match("a shared term")
+        ok &= _ok(f"[{label}] shared keyword resolves for both kinds", got == {"a": "Shared", "b": "shared"}, str(got))
+    return ok
+
+
+def test_matcher_paths_agree() -> bool:
+    texts = [text for text, _, _ in CASES] + [
+        "hip fracture after total hip arthroplasty",
+        "osteoarthritis, orif, acl tear and a fracture",
+        "arthroplastyorif",
+        "fracturefracture fracture",
+        "acl reconstructio",
+    ]
+    results = {label: [match(t) for t in texts] for label, match in _matchers(procedure=PROCEDURES, diagnosis=DIAGNOSES)}
+    baseline = results.pop("fallback")
+    ok = True
+    for label, got in results.items():
+        diffs = [(t, b, g) for t, b, g in zip(texts, baseline, got) if b != g]
+        ok &= _ok(f"[{label}] agrees with fallback on {len(texts)} texts", not diffs, str(diffs))
+    return ok
+
+
+def test_kinds_follow_kwargs() -> bool:
+    match = build_keyword_matcher(only=["alpha"])
+    got = match("alpha beta")
+    return _ok("result keys are the kwarg names", got == {"only": "alpha"}, str(got))
+
+
+def main() -> int:
+    print("=== anki_keywords.build_keyword_matcher ===\n")
+    tests = [
+        test_earliest_keyword_in_list_order,
+        test_keyword_shared_across_kinds,
+        test_matcher_paths_agree,
+        test_kinds_follow_kwargs,
+    ]
+    passed = sum(1 for t in tests if t())
+    failed = len(tests) - passed
+    print(f"\n=== RESULTS: {passed} passed, {failed} failed ===")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,19 +2,24 @@
 CasePrep v1 — legacy production pipeline.
 
 Flow: refine_query → Pinecone RAG → GPT pimp reformat → legacy anatomy_gpt catalog.
+A raw-prompt Pinecone query runs alongside refine_query and joins the RAG merge.
 Does not import v2-only modules (procedure_registry, hybrid_anatomy_builder, etc.).
 """
 
 from __future__ import annotations
 
 import asyncio
-from typing import Any, Dict, List, Optional
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Optional
 
 from fastapi.concurrency import run_in_threadpool
 
 from caseprep.schemas import build_envelope, empty_prompt_response
 from caseprep.services import ai_fallback, rag_context
 
+if TYPE_CHECKING:
+    from anatomy_gpt import Catalog
+
 V1_AI_STEPS = [
     "query_refiner",
     "snippet_filter",
@@ -26,16 +31,54 @@ V1_AI_STEPS = [
 async def run_caseprep_v1(
     prompt: str,
     *,
-    catalog: List[Dict[str, Any]],
+    catalog: Catalog,
     openai_client: Any,
 ) -> Dict[str, Any]:
     if not prompt:
         return empty_prompt_response("v1", "legacy_rag_gpt")
 
-    refined_prompt = await run_in_threadpool(ai_fallback.refine_prompt, prompt)
+    # task.cancel() can't stop a threadpool call, so the pipeline also checks this between GPT stages
+    anatomy_cancel = threading.Event()
+
+    async def run_anatomy():
+        result = await run_in_threadpool(
+            ai_fallback.run_legacy_anatomy,
+            case_prompt=prompt,
+            catalog=catalog,
+            client=openai_client,
+            cancel=anatomy_cancel,
+        )
+        print("🦴 [v1] Legacy anatomy pipeline finished")
+        return result
+
+    async def run_raw_prefetch():
+        try:
+            return await run_in_threadpool(rag_context.prefetch_snippets, prompt)
+        except Exception as e:
+            print(f"⚠️ [v1] Raw-prompt Pinecone prefetch failed: {e}")
+            return []
+
+    rag_available = rag_context.is_rag_available()
+    # Anatomy only needs the raw prompt, so it runs alongside refine → RAG → pimp
+    # (without RAG the response carries no anatomy, so it isn't started at all)
+    anatomy_task = asyncio.create_task(run_anatomy()) if rag_available else None
+    # Likewise the raw-prompt embed + Pinecone query; its hits join the refined-query merge
+    prefetch_task = asyncio.create_task(run_raw_prefetch()) if rag_available else None
+
+    def cancel_pending():
+        anatomy_cancel.set()
+        for task in (anatomy_task, prefetch_task):
+            if task is not None:
+                task.cancel()
+
+    try:
+        refined_prompt = await run_in_threadpool(ai_fallback.refine_prompt, prompt)
+    except BaseException:
+        cancel_pending()
+        raise
     print(f"🧠 [v1] Refined Prompt: {refined_prompt}")
 
-    if not rag_context.is_rag_available():
+    if not rag_available:
         body = {
             "pimpQuestions": [],
             "otherUsefulFacts": ["❌ RAG not configured (missing Pinecone/OpenAI env)."],
@@ -52,8 +95,14 @@ async def run_caseprep_v1(
             backward_compat=True,
         )
 
-    snippets = await run_in_threadpool(rag_context.fetch_snippets, refined_prompt)
+    try:
+        raw_hits = await prefetch_task
+        snippets = await run_in_threadpool(rag_context.fetch_snippets, refined_prompt, raw_hits)
+    except BaseException:
+        cancel_pending()
+        raise
     if not snippets:
+        cancel_pending()
         body = {
             "pimpQuestions": [],
             "otherUsefulFacts": ["❌ No relevant content found."],
@@ -71,21 +120,11 @@ async def run_caseprep_v1(
         )
 
     async def run_pimp():
-        result = await run_in_threadpool(ai_fallback.format_pimp_from_snippets, prompt, snippets)
+        result = await ai_fallback.aformat_pimp_from_snippets(prompt, snippets)
         print("✅ [v1] CasePrep pimp pipeline finished")
         return result
 
-    async def run_anatomy():
-        result = await run_in_threadpool(
-            ai_fallback.run_legacy_anatomy,
-            case_prompt=prompt,
-            catalog=catalog,
-            client=openai_client,
-        )
-        print("🦴 [v1] Legacy anatomy pipeline finished")
-        return result
-
-    pimp_result, anatomy_result = await asyncio.gather(run_pimp(), run_anatomy())
+    pimp_result, anatomy_result = await asyncio.gather(run_pimp(), anatomy_task)
 
     body = {
         **pimp_result,
@@ -8,7 +8,7 @@ CasePrep v2 — curated-first hybrid engine (opt-in).
 
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
 from fastapi.concurrency import run_in_threadpool
 
@@ -16,6 +16,9 @@ from caseprep.config import CasePrepConfig
 from caseprep.schemas import build_envelope, empty_prompt_response
 from caseprep.services import ai_fallback, curated_content_store, procedure_resolver, rag_context
 
+if TYPE_CHECKING:
+    from anatomy_gpt import Catalog
+
 _V2_IMPORT_ERROR: Optional[str] = None
 
 
@@ -124,7 +127,7 @@ async def _fallback_response(
     prompt: str,
     resolved: Dict[str, Any],
     config: CasePrepConfig,
-    catalog: List[Dict[str, Any]],
+    catalog: Catalog,
     openai_client: Any,
 ) -> Dict[str, Any]:
     slug = resolved.get("procedure_slug")
@@ -181,9 +184,7 @@ async def _fallback_response(
             snippets = await run_in_threadpool(rag_context.fetch_snippets, refined)
             rag_used = bool(snippets)
             if snippets and config.enable_v2_ai_fallback:
-                pimp = await run_in_threadpool(
-                    ai_fallback.format_pimp_from_snippets, prompt, snippets
-                )
+                pimp = await ai_fallback.aformat_pimp_from_snippets(prompt, snippets)
                 body.update(pimp)
                 ai_used.extend(["snippet_filter", "snippet_reformat"])
             elif snippets:
@@ -230,7 +231,7 @@ async def _fallback_response(
 async def run_caseprep_v2(
     prompt: str,
     *,
-    catalog: List[Dict[str, Any]],
+    catalog: Catalog,
     openai_client: Any,
     config: Optional[CasePrepConfig] = None,
 ) -> Dict[str, Any]:
@@ -4,7 +4,11 @@ GPT-backed CasePrep helpers (v1 primary; v2 only when explicitly enabled).
 
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from anatomy_gpt import Catalog
 
 
 def refine_prompt(user_prompt: str) -> Any:
@@ -19,15 +23,23 @@ def format_pimp_from_snippets(user_query: str, snippets: List[Any]) -> Dict[str,
     return refine_case_snippets(user_query, snippets)
 
 
+async def aformat_pimp_from_snippets(user_query: str, snippets: List[Any]) -> Dict[str, Any]:
+    """Async variant: awaits the refiner's AsyncOpenAI calls on the caller's event loop."""
+    from gpt_refiner import arefine_case_snippets
+
+    return await arefine_case_snippets(user_query, snippets)
+
+
 def run_legacy_anatomy(
     *,
     case_prompt: str,
-    catalog: List[Dict[str, Any]],
+    catalog: Catalog,
     client: Any,
+    cancel: Optional[threading.Event] = None,
 ) -> Dict[str, Any]:
     from anatomy_gpt import run_pipeline_fast
 
-    return run_pipeline_fast(case_prompt=case_prompt, catalog=catalog, client=client)
+    return run_pipeline_fast(case_prompt=case_prompt, catalog=catalog, client=client, cancel=cancel)
 
 
 def pimp_from_certified_payload(certified: Dict[str, Any]) -> Dict[str, Any]:
@@ -4,7 +4,7 @@ Pinecone RAG retrieval for CasePrep (v1 primary, v2 optional fallback).
 
 from __future__ import annotations
 
-from typing import Any, List
+from typing import Any, List, Optional
 
 from caseprep.config import rag_dependencies_available
 
@@ -20,11 +20,24 @@ def is_rag_available() -> bool:
         return False
 
 
-def fetch_snippets(refined_prompt: Any) -> List[Any]:
+def prefetch_snippets(raw_prompt: str) -> List[Any]:
     """
-    Retrieve case snippets from Pinecone. Caller should run refine_query first.
+    Raw-prompt Pinecone hits (with vectors); safe to run alongside refine_query.
+    Only meaningful when handed to fetch_snippets, which filters and re-scores them.
+    Raises if RAG is not configured — callers must guard with is_rag_available().
+    """
+    from vector_search import prefetch_raw_snippets
+
+    return prefetch_raw_snippets(raw_prompt)
+
+
+def fetch_snippets(refined_prompt: Any, extra_hits: Optional[List[Any]] = None) -> List[Any]:
+    """
+    Retrieve case snippets from Pinecone. Caller should run refine_query first;
+    extra_hits (from prefetch_snippets) are filtered like the ladder's loosest
+    query and re-scored against the refined query before being merged.
     Raises if RAG is not configured — callers must guard with is_rag_available().
     """
     from vector_search import get_case_snippets
 
-    return get_case_snippets(refined_prompt)
\ No newline at end of file
+    return get_case_snippets(refined_prompt, extra_hits=extra_hits)
\ No newline at end of file
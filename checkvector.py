@@ -1,12 +1,20 @@
 try:
     print("🚀 Running checkvector.py...")
 
-    import json
+    import orjson
     import uuid
     import os
     from pinecone import Pinecone
     from dotenv import load_dotenv
     from tqdm import tqdm
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    # gRPC client returns fetch futures natively (pip install "pinecone[grpc]")
+    try:
+        from pinecone.grpc import PineconeGRPC
+    except ImportError:
+        PineconeGRPC = None
 
     # ── Load API Keys ──
     load_dotenv()
@@ -16,7 +24,8 @@ try:
     if not api_key or not index_name:
         raise ValueError("Missing Pinecone API key or index name in .env file")
 
-    pc = Pinecone(api_key=api_key)
+    USE_GRPC = PineconeGRPC is not None
+    pc = PineconeGRPC(api_key=api_key) if USE_GRPC else Pinecone(api_key=api_key)
     index = pc.Index(index_name)
     print(f"✅ Connected to index: {index_name}")
 
@@ -24,42 +33,79 @@ try:
     input_path = "output_vectorversion_pp.jsonl"
     output_path = "to_upload.jsonl"
     BATCH_SIZE = 100
+    FETCH_WORKERS = 16   # REST fallback only
+    FETCH_WINDOW = 32    # fetch requests kept in flight
 
-    # ── Load Local Records ──
+    # ── Pass 1: collect IDs only (payloads are re-read in pass 2) ──
     print(f"📂 Reading from: {input_path}")
-    local_cards = []
-    with open(input_path, "r") as f:
+    all_ids = []
+    assigned_ids = {}  # line number -> generated ID for cards that had none
+    with open(input_path, "rb") as f:
         for i, line in enumerate(f):
-            card = json.loads(line)
-            if "id" not in card:
-                card["id"] = f"card-{uuid.uuid4().hex[:8]}"  # Assign random unique ID
-            local_cards.append(card)
+            card = orjson.loads(line)
+            if "id" in card:
+                all_ids.append(card["id"])
+            else:
+                assigned_ids[i] = f"card-{uuid.uuid4().hex[:8]}"  # Assign random unique ID
+                all_ids.append(assigned_ids[i])
 
-    all_ids = [card["id"] for card in local_cards]
     print(f"🔎 Loaded {len(all_ids)} IDs.")
 
     # ── Check for Existing IDs ──
     existing_ids = set()
-    for i in tqdm(range(0, len(all_ids), BATCH_SIZE), desc="Checking Pinecone"):
-        batch_ids = all_ids[i:i + BATCH_SIZE]
+    pool = None if USE_GRPC else ThreadPoolExecutor(max_workers=FETCH_WORKERS)
+    inflight = deque()
+
+    def collect_oldest():
+        i, fut = inflight.popleft()
         try:
-            res = index.fetch(ids=batch_ids)
-            existing_ids.update(res.vectors.keys())
+            existing_ids.update(fut.result().vectors.keys())
         except Exception as e:
             print(f"❌ Error fetching batch {i}-{i + BATCH_SIZE}: {e}")
+        pbar.update(1)
+
+    with tqdm(total=-(-len(all_ids) // BATCH_SIZE), desc="Checking Pinecone") as pbar:
+        for i in range(0, len(all_ids), BATCH_SIZE):
+            batch = all_ids[i:i + BATCH_SIZE]
+            if USE_GRPC:
+                fut = index.fetch(ids=batch, async_req=True)
+            else:
+                fut = pool.submit(index.fetch, ids=batch)
+            inflight.append((i, fut))
+            if len(inflight) >= FETCH_WINDOW:
+                collect_oldest()
+        while inflight:
+            collect_oldest()
+
+    if pool is not None:
+        pool.shutdown()
 
-    # ── Filter New Cards ──
-    new_cards = [card for card in local_cards if card["id"] not in existing_ids]
+    # ── Pass 2: stream new cards straight to the output file ──
+    # Opened lazily so an existing output file is left alone when nothing is new
+    new_count = 0
+    out = None
+    try:
+        with open(input_path, "rb") as f:
+            for i, line in enumerate(f):
+                if all_ids[i] in existing_ids:
+                    continue
+                if out is None:
+                    out = open(output_path, "wb")
+                if i in assigned_ids:
+                    card = orjson.loads(line)
+                    card["id"] = assigned_ids[i]
+                    line = orjson.dumps(card) + b"\n"
+                out.write(line if line.endswith(b"\n") else line + b"\n")
+                new_count += 1
+    finally:
+        if out is not None:
+            out.close()
 
-    print(f"✅ Total cards in file: {len(local_cards)}")
+    print(f"✅ Total cards in file: {len(all_ids)}")
     print(f"🟡 Already in index: {len(existing_ids)}")
-    print(f"🆕 New cards to upload: {len(new_cards)}")
+    print(f"🆕 New cards to upload: {new_count}")
 
-    # ── Save New Cards to Upload ──
-    if new_cards:
-        with open(output_path, "w") as f:
-            for card in new_cards:
-                f.write(json.dumps(card) + "\n")
+    if new_count:
         print(f"📁 Saved new cards to: {output_path}")
     else:
         print("🚫 No new cards to upload.")
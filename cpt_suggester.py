@@ -11,7 +11,6 @@ Pipeline:
 
 from __future__ import annotations
 
-import json
 import os
 import re
 import sqlite3
@@ -24,9 +23,12 @@ from ortho_concepts import (
     detect_ortho_concepts,
 )
 
+import orjson
 from dotenv import load_dotenv
 from openai import OpenAI
 
+from openai_http import get_http_client
+
 load_dotenv()
 
 _SCRIPT_DIR = Path(__file__).parent.resolve()
@@ -44,7 +46,7 @@ def _get_client() -> OpenAI:
     if _client is None:
         api_key = os.getenv("OPENAI_API_KEY")
         project = os.getenv("OPENAI_API_PROJECT_ID") or os.getenv("OPENAI_PROJECT_ID")
-        _client = OpenAI(api_key=api_key, project=project, timeout=60.0)
+        _client = OpenAI(api_key=api_key, project=project, timeout=60.0, http_client=get_http_client())
     return _client
 
 
@@ -180,7 +182,7 @@ def _parse_case_with_gpt(case_description: str) -> dict[str, Any]:
 
     for tc in tool_calls:
         if tc.function.name == "emit_case_parse":
-            return json.loads(tc.function.arguments or "{}")
+            return orjson.loads(tc.function.arguments or "{}")
 
     return {}
 
@@ -726,7 +728,7 @@ def _rerank_with_gpt(
         max_tokens=1400,
         messages=[
             {"role": "system", "content": _RERANK_PROMPT},
-            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
+            {"role": "user", "content": orjson.dumps(payload).decode()},
         ],
         tools=_RERANK_TOOL,
         tool_choice={"type": "function", "function": {"name": "emit_cpt_suggestions"}},
@@ -739,7 +741,7 @@ def _rerank_with_gpt(
     for tc in tool_calls:
         try:
             if tc.function.name == "emit_cpt_suggestions":
-                return json.loads(tc.function.arguments or "{}")
+                return orjson.loads(tc.function.arguments or "{}")
         except Exception:
             continue
 
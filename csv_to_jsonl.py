@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 import csv
+import io
 import json
 import sys
 from pathlib import Path
@@ -36,7 +37,7 @@ def _row_to_obj(row: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def _detect_encoding(csv_path: Path) -> str:
+def _detect_encoding(raw: bytes) -> str:
     """
     Practical, stable detection for CSVs coming from Excel/editor workflows.
 
@@ -46,8 +47,6 @@ def _detect_encoding(csv_path: Path) -> str:
     - Fall back to cp1252 (common Excel export)
     - Finally latin-1 (never errors)
     """
-    raw = csv_path.read_bytes()
-
     # BOM checks (high confidence)
     if raw.startswith(b"\xef\xbb\xbf"):
         return "utf-8-sig"   # UTF-8 with BOM
@@ -73,10 +72,12 @@ def _detect_encoding(csv_path: Path) -> str:
 
 
 def csv_to_jsonl(csv_path: Path, jsonl_path: Path) -> None:
-    chosen_enc = _detect_encoding(csv_path)
+    # Read the file once: the same bytes drive encoding detection and parsing
+    raw = csv_path.read_bytes()
+    chosen_enc = _detect_encoding(raw)
     print(f"ℹ️ Using encoding: {chosen_enc}", file=sys.stderr)
 
-    with csv_path.open("r", encoding=chosen_enc, newline="") as f_in, \
+    with io.StringIO(raw.decode(chosen_enc), newline="") as f_in, \
          jsonl_path.open("w", encoding="utf-8", newline="\n") as f_out:
 
         reader = csv.DictReader(f_in)
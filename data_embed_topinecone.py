@@ -1,8 +1,24 @@
-import os, json
+import os, re, sys, time, asyncio, hashlib, sqlite3
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import orjson
 from dotenv import load_dotenv
 from tqdm import tqdm
-from openai import OpenAI
+from openai import (
+    OpenAI, AsyncOpenAI, APIConnectionError, APITimeoutError, BadRequestError, InternalServerError, RateLimitError,
+)
 from pinecone import Pinecone
+from openai_http import get_http_client, get_async_http_client
+from openai_utils import retry_delay
+
+# gRPC client multiplexes upserts over HTTP/2 (pip install "pinecone[grpc]");
+# fall back to REST + a thread pool when the extra isn't installed.
+try:
+    from pinecone.grpc import PineconeGRPC
+except ImportError:
+    PineconeGRPC = None
 
 # ── STEP 0: Load ENV ─────────────────────────────────────────
 load_dotenv()
@@ -14,14 +30,32 @@ PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX")
 if not all([OPENAI_API_KEY, PINECONE_API_KEY, PINECONE_INDEX_NAME]):
     raise ValueError("❌ Missing one or more required environment variables.")
 
-client = OpenAI(api_key=OPENAI_API_KEY, project=OPENAI_PROJECT_ID) if OPENAI_PROJECT_ID else OpenAI(api_key=OPENAI_API_KEY)
-pc     = Pinecone(api_key=PINECONE_API_KEY)
+client  = OpenAI(api_key=OPENAI_API_KEY, project=OPENAI_PROJECT_ID, http_client=get_http_client())
+aclient = AsyncOpenAI(api_key=OPENAI_API_KEY, project=OPENAI_PROJECT_ID, http_client=get_async_http_client())
+USE_GRPC = PineconeGRPC is not None
+pc     = PineconeGRPC(api_key=PINECONE_API_KEY) if USE_GRPC else Pinecone(api_key=PINECONE_API_KEY)
 index  = pc.Index(PINECONE_INDEX_NAME)
 
 # ── Config ───────────────────────────────────────────────────
 INPUT_ROOT  = "data/lower_extremity"                      # <-- folder root
 EMBED_MODEL = "text-embedding-3-small"    # 1536-dim
-BATCH_SIZE  = 100
+BATCH_SIZE  = 100                          # pinecone upsert batch size
+EMBED_BATCH = 256                          # texts per embeddings request
+EMBED_CONCURRENCY = 8                      # in-flight embeddings requests
+MAX_RETRIES       = 6                      # per request, on 429s / transient errors
+FAILED_IDS_PATH   = "embed_failed_ids.txt"   # records that could not be embedded, one ID per line
+ASYNC_SLICE       = EMBED_BATCH * EMBED_CONCURRENCY  # records gathered per round (partial progress is upserted)
+UPSERT_WORKERS    = 4                      # REST fallback only
+UPSERT_WINDOW     = 16                     # upsert requests kept in flight
+
+# `--batch` routes embeddings through the OpenAI Batch API (50% cost, async up to 24h)
+BATCH_MODE          = "--batch" in sys.argv[1:]
+BATCH_INPUT_PATH    = "embed_batch_input.jsonl"
+BATCH_MAX_REQUESTS  = 50_000                # Batch API limit per input file
+BATCH_POLL_SECONDS  = 30
+
+# Local content-hash -> embedding cache so unchanged records skip the API on re-runs
+EMBED_CACHE_PATH    = ".embed_cache.sqlite"
 
 # ── STEP 1: Find all JSONL files under data/ ─────────────────
 jsonl_files = []
@@ -36,8 +70,6 @@ if not jsonl_files:
 print(f"✅ Found {len(jsonl_files)} .jsonl files under {INPUT_ROOT}")
 
 # ── STEP 2: Load all JSONL records ───────────────────────────
-import os, json
-
 # ── Helpers ───────────────────────────────────────────────────
 def safe_str(x) -> str:
     return str(x).strip() if x is not None else ""
@@ -65,27 +97,6 @@ def as_list_str(x) -> list[str]:
     s = safe_str(x)
     return [s] if s else []
 
-def lower_list(xs) -> list[str]:
-    return [safe_str(x).lower() for x in (xs or []) if safe_str(x)]
-
-def clean_meta(d: dict) -> dict:
-    """
-    Remove empty values and empty strings inside lists to keep metadata small
-    and Pinecone-friendly.
-    """
-    cleaned = {}
-    for k, v in d.items():
-        if v in [None, "", [], {}]:
-            continue
-        if isinstance(v, list):
-            vv = [safe_str(x) for x in v if safe_str(x)]
-            if not vv:
-                continue
-            cleaned[k] = vv
-        else:
-            cleaned[k] = v
-    return cleaned
-
 def get_source_ref(meta: dict) -> str:
     src = meta.get("source")
     if isinstance(src, dict):
@@ -100,32 +111,46 @@ seen_ids = set()
 
 ALLOWED_CATEGORIES = {"osteology", "arthrology", "muscles", "nerves", "vasculature", "approaches"}
 
-def add_line(label: str, value) -> str:
-    """
-    Clean labeled line builder for enriched_text.
-    - list -> comma-joined
-    - None/empty -> "Label:"
-    - other -> "Label: value"
-    """
-    if value is None:
-        return f"{label}:"
-    if isinstance(value, list):
-        vv = [safe_str(x) for x in value if safe_str(x)]
-        return f"{label}: {', '.join(vv)}" if vv else f"{label}:"
-    s = safe_str(value)
-    return f"{label}: {s}" if s else f"{label}:"
-
-def _get_bones(meta: dict) -> list[str]:
-    """
-    Pull bones from meta in a forgiving way.
-    Supports:
-      - meta["bones"] as list/str
-      - meta["bone"] as str
-    """
-    bones = as_list_str(meta.get("bones"))
-    if not bones:
-        bones = as_list_str(meta.get("bone"))
-    return bones
+_join = ", ".join
+
+# Known `type` values in the corpus -> category (O(1) hit for nearly every row)
+_TYPE_TO_CATEGORY = {
+    "surgical_approach":      "approaches",
+    "nerve":                  "nerves",
+    "anatomy_nerve":          "nerves",
+    "anatomy_vascular":       "vasculature",
+    "anatomy_artery":         "vasculature",
+    "anatomy_muscle":         "muscles",
+    "anatomy_ligament":       "arthrology",
+    "anatomy_bone":           "osteology",
+}
+
+# Substring fallback for unknown types, checked in priority order; first match wins
+_TYPE_CATEGORY_PATTERNS = [
+    (re.compile(r"approach"),                                        "approaches"),
+    (re.compile(r"nerve|plexus|root"),                               "nerves"),
+    (re.compile(r"artery|vein|vascular|vessel"),                     "vasculature"),
+    (re.compile(r"muscle"),                                          "muscles"),
+    (re.compile(r"ligament|meniscus|labrum|capsule|cartilage|arthro"), "arthrology"),
+    (re.compile(r"bone|osteology|bony"),                             "osteology"),
+]
+
+@lru_cache(maxsize=1024)
+def _category_for(cat: str, typ: str) -> str:
+    cat = cat.lower()
+    if cat in ALLOWED_CATEGORIES:
+        return cat
+
+    # Optional fallback mapping from "type" if you don't store category yet
+    t = typ.lower()
+    hit = _TYPE_TO_CATEGORY.get(t)
+    if hit is not None:
+        return hit
+    for rx, category in _TYPE_CATEGORY_PATTERNS:
+        if rx.search(t):
+            return category
+
+    return ""  # leave blank if unknown
 
 def _get_category(meta: dict, fallback_type: str = "") -> str:
     """
@@ -134,36 +159,17 @@ def _get_category(meta: dict, fallback_type: str = "") -> str:
 
     Prefer meta["category"] if present. Otherwise map from type when possible.
     """
-    cat = safe_str(meta.get("category")).lower()
-    if cat in ALLOWED_CATEGORIES:
-        return cat
-
-    # Optional fallback mapping from "type" if you don't store category yet
-    t = (fallback_type or "").lower()
-    if any(k in t for k in ["approach", "surgical_approach"]):
-        return "approaches"
-    if any(k in t for k in ["nerve", "plexus", "root"]):
-        return "nerves"
-    if any(k in t for k in ["artery", "vein", "vascular", "vessel"]):
-        return "vasculature"
-    if any(k in t for k in ["muscle"]):
-        return "muscles"
-    if any(k in t for k in ["ligament", "meniscus", "labrum", "capsule", "cartilage", "arthro"]):
-        return "arthrology"
-    if any(k in t for k in ["bone", "osteology", "bony"]):
-        return "osteology"
-
-    return ""  # leave blank if unknown
+    return _category_for(safe_str(meta.get("category")), fallback_type or "")
 
 for path in jsonl_files:
-    with open(path, "r", encoding="utf-8") as infile:
+    with open(path, "rb") as infile:
         for i, line in enumerate(infile, start=1):
             line = line.strip()
             if not line:
                 continue
 
             try:
-                obj = json.loads(line)
+                obj = orjson.loads(line)
 
                 doc_id  = safe_str(obj.get("id"))
                 name    = safe_str(obj.get("name"))
@@ -191,9 +197,10 @@ for path in jsonl_files:
                 region        = safe_str(meta.get("region")).lower()
                 anatomic_area = safe_str(meta.get("anatomic_area")).lower()
                 joint         = safe_str(meta.get("joint")).lower()
-                bones         = lower_list(_get_bones(meta))
+                # as_list_str already strips and drops empties, so lowercase directly
+                bones         = [b.lower() for b in (as_list_str(meta.get("bones")) or as_list_str(meta.get("bone")))]
                 category      = _get_category(meta, fallback_type=typ)
-                clinical_tags = lower_list(as_list_str(meta.get("clinical_tags")))
+                clinical_tags = [t.lower() for t in as_list_str(meta.get("clinical_tags"))]
 
                 # Store original type as lowercase string (you said you want it)
                 typ_l = typ.lower()
@@ -202,37 +209,40 @@ for path in jsonl_files:
                 # Make this THOROUGH: name/aliases + the full description text.
                 # Include the simple meta as labels so retrieval benefits from it,
                 # but don't bloat with tons of nested meta you don't want.
-                enriched_text = "\n".join([
-                    add_line("Name", name),
-                    add_line("Type", typ_l),
-                    add_line("Category", category),
-                    add_line("Aliases", aliases),
-
-                    add_line("Region", region),
-                    add_line("Anatomic area", anatomic_area),
-                    add_line("Joint", joint),
-                    add_line("Bones", bones),
-                    add_line("Clinical tags", clinical_tags),
-
-                    # This is the important part: the actual content
-                    add_line("Core description", text),
-                ]).strip()
+                # Empty fields render as "Label:" (no trailing space), same as before.
+                header = (
+                    f"Name: {name}\n"
+                    f"Type: {typ_l}\n"
+                    f"Category: {category}\n"
+                    f"Aliases: {_join(aliases)}\n"
+                    f"Region: {region}\n"
+                    f"Anatomic area: {anatomic_area}\n"
+                    f"Joint: {joint}\n"
+                    f"Bones: {_join(bones)}\n"
+                    f"Clinical tags: {_join(clinical_tags)}\n"
+                ).replace(": \n", ":\n")
+
+                # This is the important part: the actual content
+                enriched_text = (header + (f"Core description: {text}" if text else "Core description:")).strip()
 
                 # ── Flat Pinecone metadata (filterable) ───────────────────────
-                flat_meta = clean_meta({
+                # Lists above are already clean, so dropping falsy values is all
+                # that's needed to keep metadata small and Pinecone-friendly.
+                flat_meta = {
                     "name": name,
-                    "aliases": lower_list(aliases),
+                    "aliases": [a.lower() for a in aliases],
 
-                    "region": region or None,
-                    "anatomic_area": anatomic_area or None,
+                    "region": region,
+                    "anatomic_area": anatomic_area,
                     "bones": bones,              # list[str]
-                    "joint": joint or None,
+                    "joint": joint,
 
                     "type": typ_l,               # fine-grain type from your JSONL (e.g., anatomy_ligament)
-                    "category": category or None, # one of your 6 buckets (if present / mapped)
+                    "category": category,        # one of your 6 buckets (if present / mapped)
 
                     "clinical_tags": clinical_tags, # list[str]
-                })
+                }
+                flat_meta = {k: v for k, v in flat_meta.items() if v}
 
                 flat_meta["fact"] = enriched_text
 
@@ -245,26 +255,202 @@ print(f"✅ Prepared {len(records):,} records from {INPUT_ROOT}")
 
 
 # ── STEP 3: Embed + Upsert ───────────────────────────────────────────
-batch = []
-
-for doc_id, enriched_text, meta in tqdm(records, desc="🔼 Uploading to Pinecone"):
-    try:
-        emb = client.embeddings.create(
-            model=EMBED_MODEL,
-            input=enriched_text
-        ).data[0].embedding
+# ── Embedding cache ──────────────────────────────────────────────────
+cache_db = sqlite3.connect(EMBED_CACHE_PATH)
+cache_db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB NOT NULL)")
+
+def cache_key(text: str) -> str:
+    # model is part of the key so switching EMBED_MODEL never serves stale vectors
+    return hashlib.sha256(f"{EMBED_MODEL}\n{text}".encode("utf-8")).hexdigest()
+
+def split_cached(recs: list[tuple]) -> tuple[list[tuple], list[tuple]]:
+    """Return (hits as (id, emb, meta), misses as original records)."""
+    keys = [cache_key(r[1]) for r in recs]
+    found: dict[str, bytes] = {}
+    for i in range(0, len(keys), 500):
+        q = keys[i:i + 500]
+        found.update(cache_db.execute(
+            f"SELECT key, vec FROM embeddings WHERE key IN ({','.join('?' * len(q))})", q
+        ))
+
+    hits, misses = [], []
+    for r, k in zip(recs, keys):
+        blob = found.get(k)
+        if blob is None:
+            misses.append(r)
+            continue
+        vec = array("f")
+        vec.frombytes(blob)
+        hits.append((r[0], vec.tolist(), r[2]))
+    return hits, misses
 
-        # Pinecone upsert: (id, vector, metadata)
-        batch.append((doc_id, emb, meta))
+def cache_put(vectors: list[tuple], text_by_id: dict[str, str]) -> None:
+    cache_db.executemany(
+        "INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)",
+        [(cache_key(text_by_id[doc_id]), array("f", emb).tobytes()) for doc_id, emb, _ in vectors],
+    )
+    cache_db.commit()
 
-        if len(batch) >= BATCH_SIZE:
-            index.upsert(vectors=batch)
-            batch = []
+failed_ids: list[str] = []  # filled by embed_batch / embed_with_batch_api
 
+async def embed_batch(sem: asyncio.Semaphore, chunk: list[tuple]) -> list[tuple]:
+    """
+    Embed a slice of records in one request and return (id, emb, meta) tuples.
+    Rate limits and transient errors are retried with backoff; a 400 (bad
+    input) halves the slice so a single bad row doesn't sink its neighbours.
+    Rows that still fail are recorded in failed_ids.
+    """
+    for attempt in range(MAX_RETRIES):
+        try:
+            async with sem:
+                resp = await aclient.embeddings.create(
+                    model=EMBED_MODEL,
+                    input=[r[1] for r in chunk]
+                )
+            break
+        except (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError) as e:
+            if attempt == MAX_RETRIES - 1:
+                print(f"⚠️ Giving up on {len(chunk)} records starting with {chunk[0][0]}: {e}")
+                failed_ids.extend(r[0] for r in chunk)
+                return []
+            # Sleep outside the semaphore so other batches keep the slot busy
+            await asyncio.sleep(retry_delay(e, attempt))
+        except BadRequestError as e:
+            if len(chunk) == 1:
+                print(f"⚠️ Error embedding {chunk[0][0]}: {e}")
+                failed_ids.append(chunk[0][0])
+                return []
+            mid = len(chunk) // 2
+            left, right = await asyncio.gather(
+                embed_batch(sem, chunk[:mid]),
+                embed_batch(sem, chunk[mid:]),
+            )
+            return left + right
+
+    data = sorted(resp.data, key=lambda d: d.index)
+    return [(r[0], d.embedding, r[2]) for r, d in zip(chunk, data)]
+
+# ── Pipelined upserts ────────────────────────────────────────────────
+upsert_pool = None if USE_GRPC else ThreadPoolExecutor(max_workers=UPSERT_WORKERS)
+inflight: deque = deque()
+
+def _wait_oldest_upsert() -> None:
+    first_id, fut = inflight.popleft()
+    try:
+        fut.result()
     except Exception as e:
-        print(f"⚠️ Error embedding/upserting {doc_id}: {e}")
+        print(f"⚠️ Error upserting batch starting with {first_id}: {e}")
+
+def submit_upsert(vectors: list[tuple]) -> None:
+    """Queue one Pinecone upsert of (id, vector, metadata) tuples; at most UPSERT_WINDOW stay in flight."""
+    if USE_GRPC:
+        fut = index.upsert(vectors=vectors, async_req=True)
+    else:
+        fut = upsert_pool.submit(index.upsert, vectors=vectors)
+    inflight.append((vectors[0][0], fut))
+    while len(inflight) > UPSERT_WINDOW:
+        _wait_oldest_upsert()
+
+def flush_upserts() -> None:
+    while inflight:
+        _wait_oldest_upsert()
+    if upsert_pool is not None:
+        upsert_pool.shutdown()
+
+async def embed_and_upsert(recs: list[tuple]) -> None:
+    """
+    Gather embeddings for ASYNC_SLICE records at a time with at most
+    EMBED_CONCURRENCY requests in flight, and queue each finished slice's
+    upserts while the next slice is embedding.
+    """
+    sem = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+    with tqdm(total=len(recs), desc="🔼 Uploading to Pinecone") as pbar:
+        for start in range(0, len(recs), ASYNC_SLICE):
+            part = recs[start:start + ASYNC_SLICE]
+            vectors, misses = split_cached(part)
+            results = await asyncio.gather(*[
+                embed_batch(sem, misses[j:j + EMBED_BATCH])
+                for j in range(0, len(misses), EMBED_BATCH)
+            ])
+            fresh = [v for r in results for v in r]
+            cache_put(fresh, {r[0]: r[1] for r in misses})
+            vectors += fresh
+
+            for j in range(0, len(vectors), BATCH_SIZE):
+                submit_upsert(vectors[j:j + BATCH_SIZE])
+            pbar.update(len(part))
+
+def embed_with_batch_api(recs: list[tuple]) -> list[tuple]:
+    """
+    Submit every record to the Batch API, wait for completion, and join the
+    embeddings back to (id, emb, meta) by custom_id.
+    """
+    by_id = {r[0]: r for r in recs}
+    out: list[tuple] = []
+
+    for start in range(0, len(recs), BATCH_MAX_REQUESTS):
+        part = recs[start:start + BATCH_MAX_REQUESTS]
+        with open(BATCH_INPUT_PATH, "wb") as f:
+            for doc_id, enriched_text, _ in part:
+                f.write(orjson.dumps({
+                    "custom_id": doc_id,
+                    "method": "POST",
+                    "url": "/v1/embeddings",
+                    "body": {"model": EMBED_MODEL, "input": enriched_text},
+                }) + b"\n")
+
+        with open(BATCH_INPUT_PATH, "rb") as f:
+            input_file = client.files.create(file=f, purpose="batch")
+        job = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/embeddings",
+            completion_window="24h",
+        )
+        print(f"📨 Submitted batch {job.id} ({len(part):,} requests)")
+
+        while job.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(BATCH_POLL_SECONDS)
+            job = client.batches.retrieve(job.id)
+            counts = job.request_counts
+            done = f"{counts.completed:,}/{counts.total:,}" if counts else "?"
+            print(f"   ⏳ {job.id}: {job.status} ({done})")
+
+        if job.status != "completed" or not job.output_file_id:
+            print(f"⚠️ Batch {job.id} ended with status '{job.status}'")
+            failed_ids.extend(r[0] for r in part)
+            continue
 
-if batch:
-    index.upsert(vectors=batch)
+        for line in client.files.content(job.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            row = orjson.loads(line)
+            rec = by_id.get(row.get("custom_id"))
+            resp = row.get("response") or {}
+            if rec is None or row.get("error") or resp.get("status_code") != 200:
+                print(f"⚠️ Error embedding {row.get('custom_id')}: {row.get('error') or resp.get('status_code')}")
+                failed_ids.append(row.get("custom_id"))
+                continue
+            out.append((rec[0], resp["body"]["data"][0]["embedding"], rec[2]))
+
+    return out
+
+if BATCH_MODE:
+    vectors, misses = split_cached(records)
+    print(f"♻️ {len(vectors):,} cached embeddings, {len(misses):,} to submit")
+    fresh = embed_with_batch_api(misses) if misses else []
+    cache_put(fresh, {r[0]: r[1] for r in misses})
+    vectors += fresh
+    for start in tqdm(range(0, len(vectors), BATCH_SIZE), desc="🔼 Uploading to Pinecone"):
+        submit_upsert(vectors[start:start + BATCH_SIZE])
+else:
+    asyncio.run(embed_and_upsert(records))
+
+flush_upserts()
+
+if failed_ids:
+    with open(FAILED_IDS_PATH, "w", encoding="utf-8") as f:
+        f.write("\n".join(failed_ids) + "\n")
+    print(f"⚠️ {len(failed_ids):,} records were not embedded; IDs written to {FAILED_IDS_PATH}")
 
 print("✅ All done – anatomy vectors are now stored in Pinecone!")
@@ -1,8 +1,11 @@
-import os, json
+import os, sys, asyncio, hashlib
+import orjson
 from dotenv import load_dotenv
 from tqdm import tqdm
-from openai import OpenAI
+from openai import AsyncOpenAI, RateLimitError
 from pinecone import Pinecone
+from openai_http import get_async_http_client
+from openai_utils import retry_delay, token_batches
 
 # ── STEP 0: Load ENV ─────────────────────────────────────────
 load_dotenv()
@@ -14,21 +17,36 @@ PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX")
 if not all([OPENAI_API_KEY, PINECONE_API_KEY, PINECONE_INDEX_NAME]):
     raise ValueError("❌ Missing one or more required environment variables.")
 
-client = OpenAI(api_key=OPENAI_API_KEY, project=OPENAI_PROJECT_ID)
+aclient = AsyncOpenAI(api_key=OPENAI_API_KEY, project=OPENAI_PROJECT_ID, http_client=get_async_http_client())
 pc     = Pinecone(api_key=PINECONE_API_KEY)
-index  = pc.Index(PINECONE_INDEX_NAME)
+index  = pc.Index(PINECONE_INDEX_NAME, pool_threads=30)  # thread pool for async_req upserts
 
 # ── Config ───────────────────────────────────────────────────
 INPUT_JSONL  = "output_vectorversion_ob_facts.jsonl"
 EMBED_MODEL  = "text-embedding-3-small"  # 1536-dim
+EMBED_BATCH  = 128                       # max texts per embeddings request (API allows 2048)
+MAX_BATCH_TOKENS = 250_000               # stay under the 300k tokens/request cap
+EMBED_CONCURRENCY = 8                    # in-flight embeddings requests
+MAX_RETRIES  = 6                         # per batch, on 429s
+UPSERT_BATCH = 100                       # vectors per pinecone upsert
+FORCE_REEMBED = "--force" in sys.argv[1:]
+PRUNE_STALE  = "--prune" in sys.argv[1:]  # delete obfacts- vectors with no line in INPUT_JSONL
+DELETE_BATCH = 1000                      # ids per pinecone delete
+
+# Optional: exact token counts for batch packing (falls back to a char estimate)
+try:
+    import tiktoken
+    _ENC = tiktoken.encoding_for_model(EMBED_MODEL)
+except Exception:
+    _ENC = None
 
 # ── STEP 1: Load JSONL facts ─────────────────────────────────
 records = []
 
-with open(INPUT_JSONL, 'r') as infile:
+with open(INPUT_JSONL, 'rb') as infile:
     for i, line in enumerate(infile):
         try:
-            card = json.loads(line)
+            card = orjson.loads(line)
             fact = card.get("fact", "").strip()
             info = card.get("additional_info", "").strip()
             meta = card.get("metadata", {})
@@ -38,18 +56,35 @@ with open(INPUT_JSONL, 'r') as infile:
             if info:
                 full_text += f"\nNote: {info}"
 
-            # Flatten metadata with lowercase values
+            # Lowercase each metadata value once; used for both the embedded text and the filterable metadata
+            specialty = meta.get("specialty", "").lower()
+            region    = meta.get("region", "").lower()
+            diagnosis = meta.get("diagnosis", "").lower()
+            procedure = meta.get("procedure", "").lower()
+
+            # Embed both the flashcard and its metadata to improve search relevance
+            enriched_text = (
+                f"{full_text}\n"
+                f"Specialty: {specialty}\n"
+                f"Region: {region}\n"
+                f"Diagnosis: {diagnosis}\n"
+                f"Procedure: {procedure}"
+            )
+
+            # Store the full text in metadata for future inspection/filtering
             flat_meta = {
-                "text": full_text,
-                "specialty": meta.get("specialty", "").lower(),
-                "region": meta.get("region", "").lower(),
-                "diagnosis": meta.get("diagnosis", "").lower(),
-                "procedure": meta.get("procedure", "").lower(),
+                "text": enriched_text,
+                "specialty": specialty,
+                "region": region,
+                "diagnosis": diagnosis,
+                "procedure": procedure,
                 "source": "Orthobullets"
             }
 
+            # Positional IDs match what is already in the index. The skip below
+            # only checks the ID, so after editing or reordering facts rerun with --force.
             card_id = f"obfacts-{i}"
-            records.append((card_id, full_text, flat_meta))
+            records.append((card_id, enriched_text, flat_meta))
 
         except Exception as e:
             print(f"⚠️ Failed to parse line {i}: {e}")
@@ -57,31 +92,105 @@ with open(INPUT_JSONL, 'r') as infile:
 print(f"✅ Prepared {len(records):,} records from {INPUT_JSONL}")
 
 # ── STEP 2: Embed and Upsert ────────────────────────────────
-for card_id, text, meta in tqdm(records, desc="🔼 Uploading to Pinecone"):
+existing = set()
+listed = False
+try:
+    for ids in index.list(prefix="obfacts-"):
+        existing.update(ids)
+    listed = True
+except Exception as e:
+    print(f"⚠️  Could not list existing IDs, embedding everything: {e}")
+
+# Vectors whose line no longer exists (the input got shorter); only deleted with --prune
+stale = existing - {r[0] for r in records}
+if listed and stale:
+    if PRUNE_STALE:
+        stale_ids = sorted(stale)
+        for j in range(0, len(stale_ids), DELETE_BATCH):
+            index.delete(ids=stale_ids[j:j + DELETE_BATCH])
+        print(f"🧹 Deleted {len(stale_ids):,} stale obfacts- vectors")
+    else:
+        print(f"ℹ️ {len(stale):,} obfacts- vectors have no line in {INPUT_JSONL} (pass --prune to delete them)")
+
+# Skip cards already in the index (pass --force to re-embed everything)
+if not FORCE_REEMBED and existing:
+    before = len(records)
+    records = [r for r in records if r[0] not in existing]
+    print(f"⏭️ Skipping {before - len(records):,} cards already in Pinecone")
+
+def chunked(lst, n):
+    for i in range(0, len(lst), n):
+        yield lst[i:i + n]
+
+async def embed_batch(sem: asyncio.Semaphore, texts: list[str]) -> list[list[float]]:
+    for attempt in range(MAX_RETRIES):
+        try:
+            async with sem:
+                resp = await aclient.embeddings.create(model=EMBED_MODEL, input=texts)
+            return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+        except RateLimitError as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            # Sleep outside the semaphore so other batches keep the slot busy
+            await asyncio.sleep(retry_delay(e, attempt))
+
+async def embed_all(text_chunks: list[list[str]], pbar) -> list:
+    """Embed every chunk with at most EMBED_CONCURRENCY requests in flight."""
+    sem = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+    async def run(texts):
+        try:
+            return await embed_batch(sem, texts)
+        finally:
+            pbar.update(len(texts))
+
+    return await asyncio.gather(*[run(t) for t in text_chunks], return_exceptions=True)
+
+def embed_unique(texts: list[str]) -> list:
+    """
+    Embed each distinct text once and fan the vectors back out to every
+    duplicate. Returns one vector per input text (None if its batch failed).
+    """
+    slot_by_hash: dict[bytes, int] = {}
+    unique_texts, slots = [], []
+    for t in texts:
+        h = hashlib.blake2b(t.encode("utf-8"), digest_size=16).digest()
+        slot = slot_by_hash.get(h)
+        if slot is None:
+            slot = slot_by_hash[h] = len(unique_texts)
+            unique_texts.append(t)
+        slots.append(slot)
+    if len(unique_texts) < len(texts):
+        print(f"♻️ {len(texts) - len(unique_texts):,} duplicate texts reuse an existing embedding")
+
+    with tqdm(total=len(unique_texts), desc="🧠 Embedding") as pbar:
+        batches = token_batches(unique_texts, max_items=EMBED_BATCH, max_tokens=MAX_BATCH_TOKENS, enc=_ENC)
+        results = asyncio.run(embed_all([texts for _, texts in batches], pbar))
+
+    unique_embs = [None] * len(unique_texts)
+    for (start, _), embs in zip(batches, results):
+        if isinstance(embs, BaseException):
+            print(f"⚠️  Error embedding batch of {unique_texts[start][:60]!r}...: {embs}")
+            continue
+        unique_embs[start:start + len(embs)] = embs
+    return [unique_embs[slot] for slot in slots]
+
+embeddings = embed_unique([r[1] for r in records])
+
+vectors = [
+    {"id": card_id, "values": emb, "metadata": meta}
+    for (card_id, _, meta), emb in zip(records, embeddings)
+    if emb is not None
+]
+
+# Upload to Pinecone, UPSERT_BATCH vectors per request, all in flight on the client pool
+batches = list(chunked(vectors, UPSERT_BATCH))
+futures = [index.upsert(vectors=batch, async_req=True) for batch in batches]
+for batch, fut in tqdm(list(zip(batches, futures)), desc="🔼 Uploading to Pinecone"):
     try:
-        # Embed both the flashcard and its metadata to improve search relevance
-        enriched_text = (
-            f"{text}\n"
-            f"Specialty: {meta.get('specialty', '')}\n"
-            f"Region: {meta.get('region', '')}\n"
-            f"Diagnosis: {meta.get('diagnosis', '')}\n"
-            f"Procedure: {meta.get('procedure', '')}"
-        )
-
-        # Create embedding
-        emb = client.embeddings.create(
-            model=EMBED_MODEL,
-            input=enriched_text
-        ).data[0].embedding
-
-        # Store the full text in metadata for future inspection/filtering
-        meta["text"] = enriched_text
-
-        # Upload to Pinecone
-        index.upsert([(card_id, emb, meta)])
-
+        fut.get()
     except Exception as e:
-        print(f"⚠️  Error uploading {card_id}: {e}")
+        print(f"⚠️  Error uploading batch starting with {batch[0]['id']}: {e}")
 
 print("✅ All done – vectors are now stored in Pinecone!")
 
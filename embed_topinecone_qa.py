@@ -1,13 +1,16 @@
 import os
-import json
+import asyncio
 import hashlib
-import sys 
+import sys
 from typing import Any, Dict, List, Tuple
 
+import orjson
 from dotenv import load_dotenv
 from tqdm import tqdm
-from openai import OpenAI
+from openai import AsyncOpenAI, RateLimitError
 from pinecone import Pinecone
+from openai_http import get_async_http_client
+from openai_utils import retry_delay, token_batches
 
 
 # ── ENV ─────────────────────────────────────────────────────
@@ -20,17 +23,29 @@ PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX")
 if not all([OPENAI_API_KEY, PINECONE_API_KEY, PINECONE_INDEX_NAME]):
     raise ValueError("❌ Missing one or more required environment variables.")
 
-client = OpenAI(api_key=OPENAI_API_KEY, project=OPENAI_PROJECT_ID)
+aclient = AsyncOpenAI(api_key=OPENAI_API_KEY, project=OPENAI_PROJECT_ID, http_client=get_async_http_client())
 pc     = Pinecone(api_key=PINECONE_API_KEY)
-index  = pc.Index(PINECONE_INDEX_NAME)
+index  = pc.Index(PINECONE_INDEX_NAME, pool_threads=30)  # thread pool for async_req upserts
 
 # ── CONFIG ──────────────────────────────────────────────────
 INPUT_JSONL  = "normalized_millers_v1.jsonl"
 EMBED_MODEL  = "text-embedding-3-small"   # 1536-dim
 SOURCE_NAME  = "Millers"
 
-EMBED_BATCH_SIZE  = 96     # safe default; can raise if you want
+EMBED_BATCH_SIZE  = 96     # safe default; can raise if you want (API allows 2048)
+MAX_BATCH_TOKENS  = 250_000  # stay under the 300k tokens/request cap
 UPSERT_BATCH_SIZE = 100    # pinecone upsert batch size
+EMBED_CONCURRENCY = 8      # in-flight embeddings requests
+MAX_RETRIES       = 6      # per batch, on 429s
+FORCE_REEMBED     = "--force" in sys.argv[1:]
+
+
+# Optional: exact token counts for batch packing (falls back to a char estimate)
+try:
+    import tiktoken
+    _ENC = tiktoken.encoding_for_model(EMBED_MODEL)
+except Exception:
+    _ENC = None
 
 
 # ── HELPERS ─────────────────────────────────────────────────
@@ -137,18 +152,71 @@ def chunked(lst: List[Any], n: int):
     for i in range(0, len(lst), n):
         yield lst[i:i+n]
 
+async def embed_batch(sem: asyncio.Semaphore, texts: List[str]) -> List[List[float]]:
+    for attempt in range(MAX_RETRIES):
+        try:
+            async with sem:
+                resp = await aclient.embeddings.create(model=EMBED_MODEL, input=texts)
+            return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+        except RateLimitError as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            # Sleep outside the semaphore so other batches keep the slot busy
+            await asyncio.sleep(retry_delay(e, attempt))
+
+async def embed_all(text_chunks: List[List[str]], pbar) -> List[Any]:
+    """Embed every chunk with at most EMBED_CONCURRENCY requests in flight."""
+    sem = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+    async def run(texts):
+        try:
+            return await embed_batch(sem, texts)
+        finally:
+            pbar.update(len(texts))
+
+    return await asyncio.gather(*[run(t) for t in text_chunks], return_exceptions=True)
+
+def embed_unique(texts: List[str]) -> List[Any]:
+    """
+    Embed each distinct text once and fan the vectors back out to every
+    duplicate. Returns one vector per input text (None if its batch failed).
+    """
+    slot_by_hash: Dict[bytes, int] = {}
+    unique_texts, slots = [], []
+    for t in texts:
+        h = hashlib.blake2b(t.encode("utf-8"), digest_size=16).digest()
+        slot = slot_by_hash.get(h)
+        if slot is None:
+            slot = slot_by_hash[h] = len(unique_texts)
+            unique_texts.append(t)
+        slots.append(slot)
+    if len(unique_texts) < len(texts):
+        print(f"♻️ {len(texts) - len(unique_texts):,} duplicate texts reuse an existing embedding")
+
+    with tqdm(total=len(unique_texts), desc="🧠 Embedding") as pbar:
+        batches = token_batches(unique_texts, max_items=EMBED_BATCH_SIZE, max_tokens=MAX_BATCH_TOKENS, enc=_ENC)
+        results = asyncio.run(embed_all([texts for _, texts in batches], pbar))
+
+    unique_embs = [None] * len(unique_texts)
+    for (start, _), embs in zip(batches, results):
+        if isinstance(embs, BaseException):
+            print(f"⚠️ Error embedding batch of {unique_texts[start][:60]!r}...: {embs}", file=sys.stderr)
+            continue
+        unique_embs[start:start + len(embs)] = embs
+    return [unique_embs[slot] for slot in slots]
+
 
 # ── STEP 1: Load JSONL ──────────────────────────────────────
 records: List[Tuple[str, str, str, Dict[str, Any]]] = []
 # tuple = (id, full_text, enriched_text, metadata_for_pinecone)
 
-with open(INPUT_JSONL, "r", encoding="utf-8") as infile:
+with open(INPUT_JSONL, "rb") as infile:
     for i, line in enumerate(infile, start=1):
         line = line.strip()
         if not line:
             continue
         try:
-            card = json.loads(line)
+            card = orjson.loads(line)
             q = s(card.get("question"))
             a = s(card.get("answer"))
             info = s(card.get("additional_info"))
@@ -177,26 +245,34 @@ print(f"✅ Prepared {len(records):,} records from {INPUT_JSONL}")
 
 
 # ── STEP 2: Embed in batches + Upsert in batches ─────────────
-for batch in tqdm(list(chunked(records, EMBED_BATCH_SIZE)), desc="🔼 Embedding+Upserting"):
-    ids = [r[0] for r in batch]
-    enriched_texts = [r[2] for r in batch]
-    metas = [r[3] for r in batch]
-
+# Skip cards already in the index (pass --force to re-embed everything)
+if not FORCE_REEMBED:
+    existing = set()
     try:
-        emb_resp = client.embeddings.create(
-            model=EMBED_MODEL,
-            input=enriched_texts
-        )
-        vectors = [d.embedding for d in emb_resp.data]
-
-        # Build pinecone upsert payload
-        to_upsert = [(ids[j], vectors[j], metas[j]) for j in range(len(batch))]
-
-        # upsert in smaller chunks if desired
-        for up_batch in chunked(to_upsert, UPSERT_BATCH_SIZE):
-            index.upsert(up_batch)
-
+        for ids in index.list(prefix="pp-"):
+            existing.update(ids)
+    except Exception as e:
+        print(f"⚠️ Could not list existing IDs, embedding everything: {e}", file=sys.stderr)
+    if existing:
+        before = len(records)
+        records = [r for r in records if r[0] not in existing]
+        print(f"⏭️ Skipping {before - len(records):,} cards already in Pinecone")
+
+embeddings = embed_unique([r[2] for r in records])
+
+to_upsert: List[Dict[str, Any]] = [
+    {"id": card_id, "values": emb, "metadata": meta}
+    for (card_id, _, _, meta), emb in zip(records, embeddings)
+    if emb is not None
+]
+
+# Submit every upsert batch on the client's thread pool, then collect
+up_batches = list(chunked(to_upsert, UPSERT_BATCH_SIZE))
+futures = [index.upsert(vectors=up_batch, async_req=True) for up_batch in up_batches]
+for up_batch, fut in tqdm(list(zip(up_batches, futures)), desc="🔼 Upserting"):
+    try:
+        fut.get()
     except Exception as e:
-        print(f"⚠️ Error embedding/upserting batch starting with {ids[0]}: {e}", file=sys.stderr)
+        print(f"⚠️ Error upserting batch starting with {up_batch[0]['id']}: {e}", file=sys.stderr)
 
 print("✅ Done.")
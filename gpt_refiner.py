@@ -1,49 +1,84 @@
-import json
+import asyncio
+import hashlib
 import os
 import re
-from typing import List, Dict, Any
-from dotenv import load_dotenv
-from openai import OpenAI
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Optional, Tuple
+import orjson
+from openai import RateLimitError
+
+from openai_batch import run_chat_batch
+from openai_client import get_async_client, get_client
+from openai_utils import retry_delay
 
 # ── Setup ─────────────────────────────────────────────────────
-load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_PROJECT_ID = os.getenv("OPENAI_API_PROJECT_ID") or os.getenv("OPENAI_PROJECT_ID")
-
-client = OpenAI(api_key=OPENAI_API_KEY, project=OPENAI_PROJECT_ID, timeout=60.0)
+# Process-wide sync client on the shared keep-alive pool; async calls fetch the per-loop client at call time
+client = get_client()
 
 # Tunables
-SNIP_CHAR_BUDGET = 8000
-PER_SNIP_LIMIT = 800
+CTX_SNIP_TOKENS = 2000       # snippet tokens per case sent to the model (≈ the old 8000-char budget)
+PER_SNIP_TOKENS = 200        # per-snippet cap (≈ 800 chars)
 QUESTION_MAX_TOKENS = 2000   # can tune down more later if needed
 FACTS_MAX_TOKENS = 1000      # can tune down more later if needed
-MAX_SNIPPETS_FOR_REFORMAT = 45
+# Opt-in: drop snippets scoring this far below the best Pinecone match (0 = off, keep all)
+SNIP_SCORE_MARGIN = float(os.getenv("SNIP_SCORE_MARGIN", "0"))
+NEAR_DUP_JACCARD = 0.85      # shingle overlap above which two snippets count as the same
 MAX_FACTS_OUT = 20
+REFINER_CONCURRENCY = 8           # in-flight async refiner requests per process
+REFINER_TPM = int(os.getenv("REFINER_TPM", "2000000"))  # tokens-per-minute budget for async calls
+MAX_RETRIES = 5                   # per async request, on 429s
+BATCH_POLL_SECONDS = 30.0         # refine_case_snippets_batch status poll interval
+BATCH_TIMEOUT_SECONDS = 4 * 3600  # give up on the batch and refine live after this
+REFINER_MODEL = "gpt-4o-mini"
+
+# Optional: exact prompt token counts for rate limiting (falls back to a char estimate)
+try:
+    import tiktoken
+    _ENC = tiktoken.encoding_for_model(REFINER_MODEL)
+except Exception:
+    _ENC = None
+
+# Exact-match cache of refiner outputs; set REFINER_CACHE_PATH="" to keep it in memory only
+REFINER_CACHE_PATH = os.getenv("REFINER_CACHE_PATH", ".refiner_cache.sqlite")
+REFINER_CACHE_TTL = int(os.getenv("REFINER_CACHE_TTL", str(30 * 24 * 3600)))  # seconds
+REFINER_MEM_CACHE_SIZE = 512   # hot entries kept in-process in front of SQLite
 
 # ── Lightweight helpers ───────────────────────────────────────
+_RE_CODE = re.compile(r"`{3}.*?`{3}", re.S)
+# html tags | line-leading bullets | markdown rules, stripped in one pass
+_RE_NOISE = re.compile(r"<[^>]+>|^[-*•]+|[_>#]{2,}", re.M)
+_RE_QSTART = re.compile(
+    r"^(what|how|why|when|where|which|list|name|define|describe|explain|"
+    r"indications|contraindications|steps|complications)\b",
+    re.I,
+)
+_RE_LOOKS_Q = re.compile(
+    r"^(what|how|why|when|where|which|who|list|name|define|describe|explain|"
+    r"indications|contraindications|steps|complications)\b"
+)
+
+
 def _normalize_space(s: str) -> str:
-    return re.sub(r"\s+", " ", (s or "").strip())
+    # str.split/join collapses whitespace in C; same result as \s+ → " " plus strip
+    return " ".join((s or "").split())
 
 
 def _strip_noise(s: str) -> str:
-    # remove code blocks, html, heavy markdown bullets/rules
-    s = re.sub(r"`{3}.*?`{3}", " ", s, flags=re.S)
-    s = re.sub(r"<[^>]+>", " ", s)
-    s = re.sub(r"^[-*•]+\s*", "", s, flags=re.M)
-    s = re.sub(r"[_>#]{2,}", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    # remove code blocks, html, heavy markdown bullets/rules. Code blocks go
+    # first (a tag may straddle a fence); split/join collapses whitespace.
+    if "```" in s:
+        s = _RE_CODE.sub(" ", s)
+    return " ".join(_RE_NOISE.sub(" ", s).split())
 
 
 def _ensure_question_mark(q: str) -> str:
     q = _normalize_space(q)
     if q and not q.endswith("?"):
-        if re.search(
-            r"^(what|how|why|when|where|which|list|name|define|describe|explain|"
-            r"indications|contraindications|steps|complications)\b",
-            q,
-            re.I,
-        ):
+        if _RE_QSTART.search(q):
             q += "?"
     return q
 
@@ -54,21 +89,64 @@ def _format_qa(q: str, a: str) -> str:
     return f"Q: {q} A: {a if a else '(answer not provided)'}"
 
 
-def _prepare_snippets(snips: List[Any], char_budget: int) -> List[str]:
+def _shingles(s: str) -> frozenset:
+    """Lowercased 3-word shingles, used for near-duplicate detection."""
+    words = s.lower().split()
+    return frozenset(" ".join(words[i:i + 3]) for i in range(max(len(words) - 2, 1)))
+
+
+def _is_near_dup(sh: frozenset, kept: List[frozenset]) -> bool:
+    for k in kept:
+        inter = len(sh & k)
+        if inter and inter / (len(sh) + len(k) - inter) > NEAR_DUP_JACCARD:
+            return True
+    return False
+
+
+def _truncate_tokens(s: str, max_tokens: int) -> Tuple[str, int]:
+    """Cut s to max_tokens; returns (text, token count) from a single encode."""
+    if _ENC is None:
+        s = s[:max_tokens * 4]
+        return s, len(s) // 4 + 1
+    ids = _ENC.encode_ordinary(s)
+    if len(ids) > max_tokens:
+        return _ENC.decode(ids[:max_tokens]), max_tokens
+    return s, len(ids)
+
+
+def _prepare_snippets(snips: List[Any], token_budget: int) -> List[str]:
     """
-    Clean, truncate, and enforce overall character budget.
+    Clean, truncate, and enforce an overall token budget (what the API bills),
+    however many snippets that turns out to be.
     Accepts either:
       - plain strings, or
       - dicts with at least a 'text' field and optional 'source'.
 
+    When SNIP_SCORE_MARGIN is set (off by default), dicts carrying a Pinecone
+    'score' (cosine similarity to the case embedding) are dropped when they
+    trail the best match by more than the margin. Near-duplicates (overlapping
+    chunks of the same paragraph) are dropped by shingle overlap before truncation.
+
     Returns a list of snippet strings ready to send to the model.
     """
     cleaned: List[str] = []
+    kept_shingles: List[frozenset] = []
     total = 0
 
+    # Runs on every refine: bind hot globals/methods to locals once
+    strip_noise, shingles, is_near_dup, truncate = _strip_noise, _shingles, _is_near_dup, _truncate_tokens
+    limit, number = PER_SNIP_TOKENS, (int, float)
+    append, append_sh = cleaned.append, kept_shingles.append
+
+    scores = [raw["score"] for raw in snips if isinstance(raw, dict) and isinstance(raw.get("score"), number)]
+    min_score = max(scores) - SNIP_SCORE_MARGIN if scores and SNIP_SCORE_MARGIN > 0 else None
+
     for raw in snips:
         # Handle dicts from vector search: {"text": ..., "source": ...}
         if isinstance(raw, dict):
+            score = raw.get("score")
+            if min_score is not None and isinstance(score, number) and score < min_score:
+                continue
             base = (raw.get("text") or "").strip()
             src = (raw.get("source") or "").strip()
             if src:
@@ -81,120 +159,30 @@ def _prepare_snippets(snips: List[Any], char_budget: int) -> List[str]:
             # Unknown type → skip
             continue
 
-        s = _strip_noise(s)
+        s = strip_noise(s)
         if len(s) < 10:
             continue
 
+        sh = shingles(s)
+        if is_near_dup(sh, kept_shingles):
+            continue
+
         # Per-snippet limit
-        s = s[:PER_SNIP_LIMIT]
-        L = len(s) + 1
+        s, n_tokens = truncate(s, limit)
+        L = n_tokens + 1  # + separator
 
-        # Enforce global character budget
-        if cleaned and total + L > char_budget:
+        # Enforce global token budget
+        if cleaned and total + L > token_budget:
             break
 
-        cleaned.append(s)
+        append(s)
+        append_sh(sh)
         total += L
 
     return cleaned
 
 
-# ── Schema for relevance mask only ────────────────────────────
-SNIPPET_FILTER_SCHEMA = {
-    "type": "object",
-    "properties": {
-        "keepMask": {
-            "description": (
-                "Boolean mask indicating which snippets are clearly relevant "
-                "to THIS specific case. Length MUST equal the number of input snippets."
-            ),
-            "type": "array",
-            "items": {"type": "boolean"},
-        },
-    },
-    "required": ["keepMask"],
-    "additionalProperties": False,
-}
-
-FILTER_SNIPPETS_TOOL = [
-    {"type": "function", "function": {"name": "filter_snippets", "parameters": SNIPPET_FILTER_SCHEMA}}
-]
-
-
-def _filter_irrelevant_snippets(case: str, snippets: List[str]) -> List[str]:
-    """
-    Ask GPT for a keepMask and drop snippets that are clearly unrelated.
-    No scoring / ranking. We rely on Pinecone for order.
-    """
-    if not snippets:
-        return []
-
-    system_prompt = (
-        "You are an orthopaedic attending preparing a trainee for a specific case.\n"
-        "You will receive:\n"
-        "  • A case description (e.g., 'ankle ORIF for bimalleolar fracture in a diabetic', "
-        "    'total knee arthroplasty for OA', 'above-knee amputation for mangled extremity').\n"
-        "  • A list of teaching snippets from orthopaedic resources.\n\n"
-        "Your job:\n"
-        "  - For each snippet, decide if it is clearly relevant to THIS case.\n"
-        "  - Output a boolean keepMask array of the same length as the snippet list.\n\n"
-        "CLINICALLY / TEST-TAKING RELEVANT (keepMask = true):\n"
-        "  • Same region and same general topic (e.g., ankle fractures, pilon fractures,\n"
-        "    syndesmosis, ankle external fixation) for an 'ankle ORIF' case.\n"
-        "  • Closely related anatomy, biomechanics, classifications, approaches, complications, or postop care.\n"
-        "  • Classic exam/pimp questions that would reasonably come up during THIS case.\n\n"
-        "MARK AS NOT RELEVANT (keepMask = false) ONLY when:\n"
-        "  • The content is clearly about a different region (femoral shaft vs knee; forefoot vs ankle; spine vs hip).\n"
-        "  • Or a completely different topic (e.g., calcaneus surgery for an adult ankle ORIF).\n"
-        "  • Or a completely different specialty (e.g., shoulder replacement for an glenoid labrum repair in an athlete).\n"
-        "IF YOU ARE UNSURE:\n"
-        "  • Prefer keepMask = true instead of false.\n\n"
-        "Output requirements:\n"
-        "  • keepMask MUST have the same length as the input snippet list.\n"
-        "  • Do NOT rewrite snippets. Only decide keepMask.\n"
-        "  • Use the function tool ONLY; no free-text."
-    )
-
-    payload = {"case": case, "snippets": snippets}
-
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        temperature=0.0,
-        max_tokens=200,  # small, it's just booleans
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
-        ],
-        tools=FILTER_SNIPPETS_TOOL,
-        tool_choice={"type": "function", "function": {"name": "filter_snippets"}},
-        parallel_tool_calls=False,
-    )
-
-    msg = resp.choices[0].message
-    if getattr(msg, "tool_calls", None):
-        try:
-            data = json.loads(msg.tool_calls[0].function.arguments)
-        except Exception:
-            data = {}
-        keep_mask: List[bool] = data.get("keepMask", []) or []
-    else:
-        # Worst-case: model ignored tools. Keep everything.
-        keep_mask = [True] * len(snippets)
-
-    # Safety: if lengths don't match, keep everything.
-    if len(keep_mask) != len(snippets):
-        keep_mask = [True] * len(snippets)
-
-    kept = [s for s, keep in zip(snippets, keep_mask) if keep]
-
-    # Fallback: if somehow everything was dropped, keep all
-    if not kept:
-        return snippets
-
-    return kept
-
-
-# ── Final reformatter schema ──────────────────────────────────
+# ── Combined relevance mask + reformatter schema ──────────────
 QUESTIONS_OBJ_SCHEMA = {
     "type": "object",
     "properties": {
@@ -208,6 +196,14 @@ QUESTIONS_OBJ_SCHEMA = {
 CASEPREP_SCHEMA = {
     "type": "object",
     "properties": {
+        "keepMask": {
+            "description": (
+                "Boolean mask indicating which snippets are clearly relevant "
+                "to THIS specific case. Length MUST equal the number of input snippets."
+            ),
+            "type": "array",
+            "items": {"type": "boolean"},
+        },
         "pimpQuestions": {
             "type": "array",
             "items": QUESTIONS_OBJ_SCHEMA,
@@ -217,13 +213,52 @@ CASEPREP_SCHEMA = {
             "items": {"type": "string"},
         },
     },
-    "required": ["pimpQuestions", "otherUsefulFacts"],
+    "required": ["keepMask", "pimpQuestions", "otherUsefulFacts"],
     "additionalProperties": False,
 }
 
-CASEPREP_TOOL = [
-    {"type": "function", "function": {"name": "emit_caseprep", "parameters": CASEPREP_SCHEMA}}
-]
+# System prompt is a module constant so every request shares a byte-identical
+# prefix (eligible for OpenAI prompt caching); case text only goes in the user turn.
+REFINER_SYSTEM_PROMPT = (
+    "You are an orthopaedic attending preparing a trainee for ONE specific case.\n"
+    "You will receive:\n"
+    "  • A case description (e.g., 'ankle ORIF for bimalleolar fracture in a diabetic', "
+    "    'total knee arthroplasty for OA', 'above-knee amputation for mangled extremity').\n"
+    "  • A list of teaching snippets from orthopaedic resources, numbered [1]..[N].\n\n"
+    "Step 1 — keepMask: for each snippet, decide if it is clearly relevant to THIS case.\n"
+    "CLINICALLY / TEST-TAKING RELEVANT (keepMask = true):\n"
+    "  • Same region and same general topic (e.g., ankle fractures, pilon fractures,\n"
+    "    syndesmosis, ankle external fixation) for an 'ankle ORIF' case.\n"
+    "  • Closely related anatomy, biomechanics, classifications, approaches, complications, or postop care.\n"
+    "  • Classic exam/pimp questions that would reasonably come up during THIS case.\n"
+    "MARK AS NOT RELEVANT (keepMask = false) ONLY when:\n"
+    "  • The content is clearly about a different region (femoral shaft vs knee; forefoot vs ankle; spine vs hip).\n"
+    "  • Or a completely different topic (e.g., calcaneus surgery for an adult ankle ORIF).\n"
+    "  • Or a completely different specialty (e.g., shoulder replacement for an glenoid labrum repair in an athlete).\n"
+    "IF YOU ARE UNSURE: prefer keepMask = true.\n\n"
+    "Step 2 — using ONLY the snippets you kept, output TWO lists:\n"
+    "  - pimpQuestions: high-yield intraop/pimp-style Q&A pairs drawn DIRECTLY from snippets.\n"
+    "    Only create a question if the snippet clearly supports an answer.\n"
+    "    Keep questions short and surgical.\n"
+    "  - otherUsefulFacts: short standalone facts that help with the case.\n\n"
+    "Rules:\n"
+    "  - Do NOT invent facts.\n"
+    "  - Prefer being faithful to the snippet wording.\n"
+    "  - Avoid duplicates.\n"
+    "  - If a snippet is already formatted like 'Q: ... A: ...', preserve it.\n\n"
+    "Output requirements:\n"
+    "  - Respond with the JSON object ONLY; no free-text.\n"
+    "  - keepMask MUST have one entry per snippet: keepMask[0] is snippet [1], and so on.\n"
+    "  - pimpQuestions must be an array of objects: {question: string, answer: string}\n"
+    "  - otherUsefulFacts must be an array of short strings.\n"
+)
+
+# Structured Outputs: the message content itself is the JSON object, no tool-call
+# wrapper. strict=True guarantees it matches the schema, so parsing can't fail.
+CASEPREP_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "emit_caseprep", "schema": CASEPREP_SCHEMA, "strict": True},
+}
 
 def _looks_like_question(q: str) -> bool:
     q = (q or "").strip().lower()
@@ -231,134 +266,336 @@ def _looks_like_question(q: str) -> bool:
         return False
     if q.endswith("?"):
         return True
-    return bool(re.match(r"^(what|how|why|when|where|which|who|list|name|define|describe|explain|indications|contraindications|steps|complications)\b", q))
+    return bool(_RE_LOOKS_Q.match(q))
+
+
+# ── Single-call refiner (mask + reformat) ────────────────────
+def _content_json(content: Optional[str]) -> Dict[str, Any]:
+    """Parse the structured-output content; {} on refusal or empty content."""
+    try:
+        return orjson.loads(content or "{}")
+    except orjson.JSONDecodeError:
+        return {}
 
 
-# ── Single-stage reformatter (after masking) ──────────────────
-def _extract_tool_args(msg, tool_name: str) -> Dict[str, Any]:
-    """Find tool call by name and parse JSON args safely."""
-    tool_calls = getattr(msg, "tool_calls", None) or []
-    for tc in tool_calls:
+def _user_content(user_query: str, snippets: List[str]) -> str:
+    # Plain numbered text: fewer tokens than a JSON-quoted payload, and snippets
+    # are already single-line after _strip_noise
+    return f"CASE: {user_query}\n\nSNIPPETS:\n" + "\n\n".join(f"[{i}] {s}" for i, s in enumerate(snippets, 1))
+
+
+def _refine_request(user_query: str, snippets: List[str]) -> Dict[str, Any]:
+    return dict(
+        model=REFINER_MODEL,
+        temperature=0.1,       # tighter for extractive behavior
+        max_tokens=1100,       # mask booleans + ~20 Qs + facts
+        messages=[
+            {"role": "system", "content": REFINER_SYSTEM_PROMPT},
+            {"role": "user", "content": _user_content(user_query, snippets)},
+        ],
+        response_format=CASEPREP_RESPONSE_FORMAT,
+        extra_body={"prompt_cache_key": "caseprep-refiner-v3"},
+    )
+
+
+class _AsyncLimiter:
+    """Caps in-flight requests and paces estimated tokens against a per-minute bucket."""
+
+    def __init__(self, max_concurrent: int, tpm: int) -> None:
+        self.max_concurrent = max_concurrent
+        self.tpm = tpm
+        self.tokens = float(tpm)
+        self.last = time.monotonic()
+        self.sem: Optional[asyncio.Semaphore] = None
+        self.loop = None
+
+    @asynccontextmanager
+    async def acquire(self, est_tokens: int):
+        # Semaphores bind to one event loop; asyncio.run() callers each get a fresh one
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.sem, self.loop = asyncio.Semaphore(self.max_concurrent), loop
+        est_tokens = min(est_tokens, self.tpm)
+        async with self.sem:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.tpm, self.tokens + (now - self.last) * self.tpm / 60.0)
+                self.last = now
+                if self.tokens >= est_tokens:
+                    self.tokens -= est_tokens
+                    break
+                await asyncio.sleep((est_tokens - self.tokens) * 60.0 / self.tpm)
+            yield
+
+
+_limiter = _AsyncLimiter(REFINER_CONCURRENCY, REFINER_TPM)
+
+
+def _estimate_tokens(req: Dict[str, Any]) -> int:
+    # OpenAI counts max_tokens against TPM up front, so include it
+    text = "".join(m["content"] for m in req["messages"])
+    prompt = len(_ENC.encode_ordinary(text)) if _ENC is not None else len(text) // 3 + 1
+    return prompt + req.get("max_tokens", 0)
+
+
+async def _acreate(**req):
+    """AsyncOpenAI chat.completions.create behind the shared limiter, retrying 429s."""
+    est = _estimate_tokens(req)
+    for attempt in range(MAX_RETRIES):
         try:
-            fn = tc.function
-            if fn and fn.name == tool_name:
-                return json.loads(fn.arguments or "{}")
-        except Exception:
-            continue
-    return {}
+            async with _limiter.acquire(est):
+                return await get_async_client().chat.completions.create(**req)
+        except RateLimitError as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            # Sleep outside the limiter so other requests keep the slot busy
+            await asyncio.sleep(retry_delay(e, attempt))
 
 
-def _reformat_snippets(user_query: str, snippets: List[str]) -> Dict[str, Any]:
+def _refine_snippets(user_query: str, snippets: List[str]) -> Dict[str, Any]:
     """
-    Take pre-cleaned, relevance-filtered snippets and produce:
+    One GPT call that masks out irrelevant snippets and, from the rest, produces:
       - pimpQuestions: list of 'Q: ... A: ...' strings (ONLY when Q/A is obvious)
       - otherUsefulFacts: list of short facts, close to original
     """
-    if not snippets:
-        return {"pimpQuestions": [], "otherUsefulFacts": []}
+    resp = client.chat.completions.create(**_refine_request(user_query, snippets))
+    return _parse_caseprep(resp.choices[0].message, len(snippets))
 
-    snippets = snippets[:MAX_SNIPPETS_FOR_REFORMAT]
-
-    system_prompt = (
-        "You are an orthopaedic attending preparing a trainee for ONE specific case.\n"
-        "You will be given:\n"
-        "  1) A case prompt\n"
-        "  2) A list of teaching snippets (already filtered for relevance)\n\n"
-        "Your job is to output TWO lists:\n"
-        "  - pimpQuestions: high-yield intraop/pimp-style Q&A pairs drawn DIRECTLY from snippets.\n"
-        "    Only create a question if the snippet clearly supports an answer.\n"
-        "    Keep questions short and surgical.\n"
-        "  - otherUsefulFacts: short standalone facts that help with the case.\n\n"
-        "Rules:\n"
-        "  - Do NOT invent facts.\n"
-        "  - Prefer being faithful to the snippet wording.\n"
-        "  - Avoid duplicates.\n"
-        "  - If a snippet is already formatted like 'Q: ... A: ...', preserve it.\n\n"
-        "Output requirements:\n"
-        "  - Use the function tool ONLY.\n"
-        "  - pimpQuestions must be an array of objects: {question: string, answer: string}\n"
-        "  - otherUsefulFacts must be an array of short strings.\n"
-    )
 
-    payload = {"case": user_query, "snippets": snippets}
+async def _arefine_snippets(user_query: str, snippets: List[str]) -> Dict[str, Any]:
+    resp = await _acreate(**_refine_request(user_query, snippets))
+    return _parse_caseprep(resp.choices[0].message, len(snippets))
 
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        temperature=0.1,       # tighter for extractive behavior
-        max_tokens=900,        # plenty for ~20 Qs + facts
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
-        ],
-        tools=CASEPREP_TOOL,
-        tool_choice={"type": "function", "function": {"name": "emit_caseprep"}},
-        parallel_tool_calls=False,
-    )
 
-    msg = resp.choices[0].message
-    data = _extract_tool_args(msg, "emit_caseprep")
+def _log_keep_mask(data: Dict[str, Any], n_snippets: int) -> None:
+    # The model's questions/facts are already filtered; the mask is telemetry only
+    keep_mask = data.get("keepMask") or []
+    if len(keep_mask) == n_snippets:
+        print(f"🧹 Refiner kept {sum(map(bool, keep_mask))}/{n_snippets} snippets")
 
+
+def _parse_caseprep(msg, n_snippets: int) -> Dict[str, Any]:
+    data = _content_json(getattr(msg, "content", None))
+    _log_keep_mask(data, n_snippets)
+    return _caseprep_from_args(data)
+
+
+def _dedupe_ci(items: List[str]) -> List[str]:
+    """Case-insensitive, order-preserving dedupe (first spelling wins)."""
+    first: Dict[str, str] = {}
+    for s in items:
+        first.setdefault(s.lower(), s)
+    return list(first.values())
+
+
+def _drop_near_dups(items: List[str]) -> List[str]:
+    """Keep the first of any items whose shingle overlap exceeds NEAR_DUP_JACCARD."""
+    out: List[str] = []
+    kept: List[frozenset] = []
+    for s in items:
+        sh = _shingles(s.lower())
+        if not _is_near_dup(sh, kept):
+            out.append(s)
+            kept.append(sh)
+    return out
+
+
+def _caseprep_from_args(data: Dict[str, Any]) -> Dict[str, Any]:
     raw_qs = data.get("pimpQuestions", []) or []
     raw_facts = data.get("otherUsefulFacts", []) or []
 
-    pimp_questions: List[str] = []
-    other_facts: List[str] = []
+    pairs = [
+        ((obj.get("question") or "").strip(), (obj.get("answer") or "").strip())
+        for obj in raw_qs
+        if isinstance(obj, dict)
+    ]
 
-    seen_q = set()
-    for obj in raw_qs:
-        if not isinstance(obj, dict):
-            continue
-        q = (obj.get("question") or "").strip()
-        a = (obj.get("answer") or "").strip()
-        if not q:
-            continue
+    # _format_qa output is already space-normalized, so lowercasing is the whole dedupe key
+    pimp_questions = _drop_near_dups(
+        _dedupe_ci([_format_qa(q, a) for q, a in pairs if q and _looks_like_question(q)])
+    )
 
-        if not _looks_like_question(q):
-            s = _normalize_space(q)
-            if s:
-                other_facts.append(s)
-            continue
+    # Statements the model filed as questions become facts
+    other_facts = [_normalize_space(q) for q, _ in pairs if q and not _looks_like_question(q)]
 
-        formatted = _format_qa(q, a)
-        key = _normalize_space(formatted).lower()
-        if key in seen_q:
-            continue
-        seen_q.add(key)
-        pimp_questions.append(formatted)
-
-    seen_f = set()
-    for f in raw_facts:
-        if not isinstance(f, str):
-            continue
-        s = _normalize_space(f)
-        if not s:
-            continue
-        k = s.lower()
-        if k in seen_f:
-            continue
-        seen_f.add(k)
-        other_facts.append(s)
-        if len(other_facts) >= MAX_FACTS_OUT:
-            break
+    facts = _dedupe_ci([s for s in (_normalize_space(f) for f in raw_facts if isinstance(f, str)) if s])
+    other_facts.extend(facts[:max(MAX_FACTS_OUT - len(other_facts), 0)])
 
     return {"pimpQuestions": pimp_questions, "otherUsefulFacts": other_facts}
 
+
+# ── Output cache ──────────────────────────────────────────────
+_cache_db = None
+_cache_lock = threading.Lock()
+# key -> (written at, orjson bytes); bytes so every hit decodes a fresh dict callers may mutate
+_mem_cache: "OrderedDict[bytes, Tuple[int, bytes]]" = OrderedDict()
+
+
+def _get_cache_db():
+    global _cache_db
+    if _cache_db is None and REFINER_CACHE_PATH:
+        db = sqlite3.connect(REFINER_CACHE_PATH, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS refiner_cache "
+            "(key BLOB PRIMARY KEY, value BLOB NOT NULL, ts INTEGER NOT NULL DEFAULT 0)"
+        )
+        try:
+            # Cache files written before the TTL column existed
+            db.execute("ALTER TABLE refiner_cache ADD COLUMN ts INTEGER NOT NULL DEFAULT 0")
+        except sqlite3.OperationalError:
+            pass
+        _cache_db = db
+    return _cache_db
+
+
+# The full request for an empty case: model, sampling settings, schema, system
+# prompt and user-message scaffolding. Editing any of them changes every cache key.
+_REQUEST_FINGERPRINT = orjson.dumps(_refine_request("", []))
+
+
+def _cache_key(user_query: str, prepped: List[str]) -> bytes:
+    h = hashlib.blake2b(_REQUEST_FINGERPRINT, digest_size=16)
+    # Case text is normalized so whitespace/case variants of the same prompt share an entry
+    h.update(orjson.dumps([_normalize_space(user_query).lower(), prepped]))
+    return h.digest()
+
+
+def _mem_put(key: bytes, ts: int, value: bytes) -> None:
+    _mem_cache[key] = (ts, value)
+    _mem_cache.move_to_end(key)
+    if len(_mem_cache) > REFINER_MEM_CACHE_SIZE:
+        _mem_cache.popitem(last=False)
+
+
+def _cache_get(key: bytes) -> Optional[Dict[str, Any]]:
+    cutoff = int(time.time()) - REFINER_CACHE_TTL
+    with _cache_lock:
+        hit = _mem_cache.get(key)
+        if hit is not None:
+            if hit[0] >= cutoff:
+                _mem_cache.move_to_end(key)
+                return orjson.loads(hit[1])
+            del _mem_cache[key]
+        db = _get_cache_db()
+        if db is None:
+            return None
+        row = db.execute(
+            "SELECT value, ts FROM refiner_cache WHERE key = ? AND ts >= ?", (key, cutoff)
+        ).fetchone()
+        if row is None:
+            return None
+        _mem_put(key, row[1], row[0])
+        return orjson.loads(row[0])
+
+
+def _cache_put(key: bytes, result: Dict[str, Any]) -> None:
+    value = orjson.dumps(result)
+    ts = int(time.time())
+    with _cache_lock:
+        _mem_put(key, ts, value)
+        db = _get_cache_db()
+        if db is None:
+            return
+        db.execute(
+            "INSERT OR REPLACE INTO refiner_cache (key, value, ts) VALUES (?, ?, ?)", (key, value, ts)
+        )
+        db.commit()
+
+
 # ── Public API ────────────────────────────────────────────────
 def refine_case_snippets(user_query: str, snippets: List[Any]) -> Dict[str, Any]:
     """
     Pipeline:
       1) Clean + truncate raw snippets (strings or metadata dicts).
-      2) Use GPT to:
-           - mask out clearly irrelevant snippets for this specific case.
-      3) Use a second GPT call to:
-           - lightly reformat remaining snippets into 'pimpQuestions' and 'otherUsefulFacts'
+      2) Use a single GPT call to:
+           - mask out clearly irrelevant snippets for this specific case, and
+           - lightly reformat the remaining snippets into 'pimpQuestions' and 'otherUsefulFacts'
              WITHOUT aggressively summarizing away content.
     """
-    prepped = _prepare_snippets(snippets, SNIP_CHAR_BUDGET)
+    prepped = _prepare_snippets(snippets, CTX_SNIP_TOKENS)
     if not prepped:
         return {"pimpQuestions": [], "otherUsefulFacts": []}
 
-    kept = _filter_irrelevant_snippets(user_query, prepped)
+    key = _cache_key(user_query, prepped)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    result = _refine_snippets(user_query, prepped)
+    _cache_put(key, result)
+    return result
+
+
+def _prepare_and_lookup(
+    user_query: str, snippets: List[Any]
+) -> Tuple[List[str], Optional[bytes], Optional[Dict[str, Any]]]:
+    prepped = _prepare_snippets(snippets, CTX_SNIP_TOKENS)
+    if not prepped:
+        return prepped, None, None
+    key = _cache_key(user_query, prepped)
+    return prepped, key, _cache_get(key)
+
+
+async def arefine_case_snippets(user_query: str, snippets: List[Any]) -> Dict[str, Any]:
+    """Async refine_case_snippets on the shared AsyncOpenAI client."""
+    # Tokenizing/shingling and the SQLite cache (lock + commit) block, so keep them off the event loop
+    prepped, key, cached = await asyncio.to_thread(_prepare_and_lookup, user_query, snippets)
+    if not prepped:
+        return {"pimpQuestions": [], "otherUsefulFacts": []}
+    if cached is not None:
+        return cached
 
-    result = _reformat_snippets(user_query, kept)
+    result = await _arefine_snippets(user_query, prepped)
+    await asyncio.to_thread(_cache_put, key, result)
     return result
+
+
+# ── Offline bulk refinement (Batch API) ───────────────────────
+def refine_case_snippets_batch(
+    jobs: List[Tuple[str, List[Any]]],
+    *,
+    poll_seconds: float = BATCH_POLL_SECONDS,
+    timeout_s: float = BATCH_TIMEOUT_SECONDS,
+) -> List[Dict[str, Any]]:
+    """
+    refine_case_snippets for bulk, non-interactive work (library rebuilds,
+    backfills) through the Batch API: half the token price and outside the
+    live rate limits, at the cost of minutes-to-hours latency.
+
+    Jobs past the Batch API's per-batch limits are split across several
+    batches. Cache hits skip the batch; any case the batch doesn't return (failure,
+    expiry, timeout) is refined live so every job gets a result, in input order.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(jobs)
+    pending: Dict[str, Tuple[int, str, List[str], bytes]] = {}
+
+    for i, (user_query, snippets) in enumerate(jobs):
+        prepped = _prepare_snippets(snippets, CTX_SNIP_TOKENS)
+        if not prepped:
+            results[i] = {"pimpQuestions": [], "otherUsefulFacts": []}
+            continue
+        key = _cache_key(user_query, prepped)
+        cached = _cache_get(key)
+        if cached is not None:
+            results[i] = cached
+            continue
+        pending[f"case-{i}"] = (i, user_query, prepped, key)
+
+    if pending:
+        bodies = {cid: _refine_request(q, prepped) for cid, (_, q, prepped, _) in pending.items()}
+        contents = run_chat_batch(
+            client, bodies, name="refiner_batch", poll_seconds=poll_seconds, timeout_s=timeout_s
+        )
+
+        for cid, (i, user_query, prepped, key) in pending.items():
+            if cid in contents:
+                data = _content_json(contents[cid])
+                _log_keep_mask(data, len(prepped))
+                result = _caseprep_from_args(data)
+            else:
+                result = _refine_snippets(user_query, prepped)
+            _cache_put(key, result)
+            results[i] = result
+
+    return results
@@ -6,12 +6,13 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.concurrency import run_in_threadpool
 
-from anatomy_gpt import load_catalog_from_jsonl_file, run_pipeline_fast
+from anatomy_gpt import Catalog, run_pipeline_fast
 from anki_ortho_context import (
     AnkiOrthoContextRequest,
     build_anki_ortho_context_response,
 )
 from openai import OpenAI
+import openai_client
 
 from caseprep.api.routes.registry import router as registry_router
 from caseprep.api.routes.factory import router as factory_router
@@ -45,7 +46,7 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-CATALOG: List[Dict[str, Any]] = []
+CATALOG: Catalog = Catalog([])
 OPENAI_CLIENT: Optional[OpenAI] = None
 
 
@@ -53,18 +54,13 @@ OPENAI_CLIENT: Optional[OpenAI] = None
 def _startup():
     global CATALOG, OPENAI_CLIENT
 
-    CATALOG = []
-    for p in APPROACH_CATALOG_PATHS:
-        CATALOG.extend(load_catalog_from_jsonl_file(p))
+    CATALOG = Catalog.from_jsonl(*APPROACH_CATALOG_PATHS)
 
     print(f"✅ Loaded approach catalog: {len(CATALOG)} items")
     for p in APPROACH_CATALOG_PATHS:
         print(f"   - {p}")
 
-    OPENAI_CLIENT = OpenAI(
-        api_key=os.getenv("OPENAI_API_KEY"),
-        project=os.getenv("OPENAI_PROJECT_ID"),
-    )
+    OPENAI_CLIENT = openai_client.get_client()
     print("✅ OpenAI client initialized")
 
     # Warm curated store for /health (non-fatal if missing)
@@ -78,6 +74,12 @@ def _startup():
     )
 
 
+@app.on_event("shutdown")
+async def _shutdown():
+    # Release the shared OpenAI keep-alive pools
+    await openai_client.aclose()
+
+
 @app.get("/")
 def read_root():
     return {"message": "SnapOrtho CasePrep API is live."}
@@ -0,0 +1,99 @@
+"""
+OpenAI Batch API runner for chat completions.
+
+Offline bulk work (refiner cache prewarms, Anki deck labelling) sends its
+requests as /v1/batches jobs: half the token price and outside the live rate
+limits, at the cost of minutes-to-hours turnaround. A single batch accepts at
+most 50,000 requests and a 200 MB input file, so larger workloads are split
+into several batches that are all submitted up front and then polled together.
+"""
+
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+import orjson
+
+BATCH_MAX_REQUESTS = 50_000
+BATCH_MAX_BYTES = 190 * 1024 * 1024  # under the 200 MB file cap, leaving room for the multipart framing
+BATCH_POLL_SECONDS = 30.0
+BATCH_TIMEOUT_SECONDS = 24 * 3600.0
+_TERMINAL = ("completed", "failed", "expired", "cancelled")
+
+
+def _chunk_lines(
+    lines: List[bytes], max_requests: int = BATCH_MAX_REQUESTS, max_bytes: int = BATCH_MAX_BYTES
+) -> Iterator[Tuple[bytes, int]]:
+    """Yield (jsonl payload, request count) chunks that each fit in one batch."""
+    chunk: List[bytes] = []
+    size = 0
+    for line in lines:
+        if chunk and (len(chunk) >= max_requests or size + len(line) + 1 > max_bytes):
+            yield b"\n".join(chunk), len(chunk)
+            chunk, size = [], 0
+        chunk.append(line)
+        size += len(line) + 1
+    if chunk:
+        yield b"\n".join(chunk), len(chunk)
+
+
+def run_chat_batch(
+    client,
+    bodies: Dict[str, Dict[str, Any]],
+    *,
+    name: str = "chat_batch",
+    poll_seconds: float = BATCH_POLL_SECONDS,
+    timeout_s: float = BATCH_TIMEOUT_SECONDS,
+) -> Dict[str, str]:
+    """
+    Submit custom_id -> chat-completion body to /v1/batches; returns
+    custom_id -> message content for every request that succeeded. Batches
+    still running at the deadline are cancelled; callers handle what's missing.
+    """
+    if not bodies:
+        return {}
+
+    lines = []
+    for custom_id, body in bodies.items():
+        body = dict(body)
+        # The Batch API takes the raw request body, so extra_body fields go inline
+        body.update(body.pop("extra_body", {}))
+        line = {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}
+        lines.append(orjson.dumps(line))
+
+    batches = []
+    for part, (payload, n) in enumerate(_chunk_lines(lines), 1):
+        upload = client.files.create(file=(f"{name}_{part}.jsonl", payload), purpose="batch")
+        batch = client.batches.create(
+            input_file_id=upload.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        print(f"📦 Submitted batch {batch.id} ({n:,} requests)")
+        batches.append(batch)
+
+    deadline = time.monotonic() + timeout_s
+    out: Dict[str, str] = {}
+    for batch in batches:
+        while batch.status not in _TERMINAL:
+            if time.monotonic() > deadline:
+                print(f"⏱️ Batch {batch.id} still {batch.status}; cancelling")
+                client.batches.cancel(batch.id)
+                break
+            time.sleep(poll_seconds)
+            batch = client.batches.retrieve(batch.id)
+        print(f"📦 Batch {batch.id} {batch.status}")
+
+        if not batch.output_file_id:
+            continue
+        for raw in client.files.content(batch.output_file_id).content.splitlines():
+            if not raw.strip():
+                continue
+            row = orjson.loads(raw)
+            resp = row.get("response") or {}
+            if resp.get("status_code") != 200:
+                continue
+            try:
+                out[row["custom_id"]] = resp["body"]["choices"][0]["message"]["content"]
+            except (KeyError, IndexError, TypeError):
+                continue
+    return out
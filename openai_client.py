@@ -0,0 +1,66 @@
+"""
+Process-wide OpenAI clients.
+
+Request-path modules import these instead of building their own OpenAI(...),
+so credentials are read in one place and every call shares the openai_http
+pools. Both clients are created lazily on first use; the async one follows
+openai_http's per-event-loop pool and is rebuilt when the loop changes.
+"""
+
+import asyncio
+import os
+from typing import Optional
+
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, OpenAI
+
+from openai_http import aclose_http_clients, get_async_http_client, get_http_client
+
+load_dotenv()
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_PROJECT_ID = os.getenv("OPENAI_API_PROJECT_ID") or os.getenv("OPENAI_PROJECT_ID")
+OPENAI_TIMEOUT = 60.0
+
+_CLIENT: Optional[OpenAI] = None
+_ASYNC_CLIENT: Optional[AsyncOpenAI] = None
+_ASYNC_HTTP = None  # the loop-bound pool _ASYNC_CLIENT was built on
+
+
+def get_client() -> OpenAI:
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = OpenAI(
+            api_key=OPENAI_API_KEY,
+            project=OPENAI_PROJECT_ID,
+            timeout=OPENAI_TIMEOUT,
+            http_client=get_http_client(),
+        )
+    return _CLIENT
+
+
+def get_async_client() -> AsyncOpenAI:
+    """AsyncOpenAI on the running loop's pool (outside a loop: a fresh, uncached client)."""
+    global _ASYNC_CLIENT, _ASYNC_HTTP
+    http = get_async_http_client()
+    if _ASYNC_CLIENT is None or http is not _ASYNC_HTTP:
+        client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            project=OPENAI_PROJECT_ID,
+            timeout=OPENAI_TIMEOUT,
+            http_client=http,
+        )
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return client
+        _ASYNC_CLIENT, _ASYNC_HTTP = client, http
+    return _ASYNC_CLIENT
+
+
+async def aclose() -> None:
+    """Drop both clients and close their shared pools (FastAPI shutdown)."""
+    global _CLIENT, _ASYNC_CLIENT, _ASYNC_HTTP
+    _CLIENT = None
+    _ASYNC_CLIENT = None
+    _ASYNC_HTTP = None
+    await aclose_http_clients()
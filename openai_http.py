@@ -0,0 +1,79 @@
+"""
+Shared httpx transports for OpenAI clients.
+
+Passing one pooled client via OpenAI(http_client=...) lets every OpenAI call in
+a process reuse warm TCP/TLS connections. HTTP/2 multiplexing is enabled when
+the `h2` package is installed (pip install "httpx[http2]"); otherwise httpx
+stays on HTTP/1.1 with the same pool.
+"""
+
+import asyncio
+import weakref
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+HTTP_TIMEOUT = 60.0
+# Keep idle connections warm well past httpx's 5s default so sporadic requests skip the TLS handshake
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=60.0)
+
+_HTTP: Optional[httpx.Client] = None
+# id(loop) -> (weakref to loop, pool): httpx async pools can't be shared across event loops
+_ASYNC_HTTP: Dict[int, Tuple["weakref.ref[asyncio.AbstractEventLoop]", httpx.AsyncClient]] = {}
+
+
+def get_http_client() -> httpx.Client:
+    global _HTTP
+    if _HTTP is None:
+        _HTTP = httpx.Client(http2=HTTP2_AVAILABLE, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+    return _HTTP
+
+
+def _new_async_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(http2=HTTP2_AVAILABLE, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Async counterpart for AsyncOpenAI, one pool per running event loop (a pool
+    reused on a second loop fails with "Event loop is closed" or hangs).
+
+    Called outside a running loop (module-level AsyncOpenAI in scripts that make
+    a single asyncio.run) it returns a fresh, uncached client that binds to the
+    first loop that uses it.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _new_async_http_client()
+
+    entry = _ASYNC_HTTP.get(id(loop))
+    if entry is not None and entry[0]() is loop and not entry[1].is_closed:
+        return entry[1]
+
+    # Forget pools whose loop has closed; their connections died with it
+    for key, (ref, _) in list(_ASYNC_HTTP.items()):
+        old = ref()
+        if old is None or old.is_closed():
+            del _ASYNC_HTTP[key]
+
+    client = _new_async_http_client()
+    _ASYNC_HTTP[id(loop)] = (weakref.ref(loop), client)
+    return client
+
+
+async def aclose_http_clients() -> None:
+    """Close the running loop's async pool and the sync pool (app shutdown); get_* opens fresh ones."""
+    global _HTTP
+    entry = _ASYNC_HTTP.pop(id(asyncio.get_running_loop()), None)
+    if entry is not None:
+        await entry[1].aclose()
+    if _HTTP is not None:
+        _HTTP.close()
+        _HTTP = None
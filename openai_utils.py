@@ -0,0 +1,40 @@
+"""
+Small helpers shared by the OpenAI callers (refiner, embed scripts, Anki reformat scripts).
+"""
+
+import random
+from typing import List, Optional, Tuple
+
+
+def retry_delay(e: Exception, attempt: int) -> float:
+    """Honour Retry-After when the API sends it, else exponential backoff with jitter."""
+    try:
+        return float(e.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return 2 ** attempt + random.random()
+
+
+def token_batches(
+    texts: List[str], *, max_items: int, max_tokens: int, enc=None
+) -> List[Tuple[int, List[str]]]:
+    """
+    Greedily pack texts into (start_index, texts) batches of at most max_items
+    items and max_tokens tokens, so no request trips the per-request cap.
+    enc is a tiktoken encoding; without one token counts are a char estimate.
+    """
+    if enc is not None:
+        counts = [len(ids) for ids in enc.encode_ordinary_batch(texts)]
+    else:
+        counts = [len(t) // 3 + 1 for t in texts]  # conservative estimate without tiktoken
+
+    batches: List[Tuple[int, List[str]]] = []
+    start, cur, cur_tokens = 0, [], 0
+    for i, (t, n) in enumerate(zip(texts, counts)):
+        if cur and (cur_tokens + n > max_tokens or len(cur) >= max_items):
+            batches.append((start, cur))
+            start, cur, cur_tokens = i, [], 0
+        cur.append(t)
+        cur_tokens += n
+    if cur:
+        batches.append((start, cur))
+    return batches
@@ -0,0 +1,38 @@
+"""
+Shared Pinecone client for the API process.
+
+vector_search (CasePrep v1 RAG) and anki_ortho_context both query the same
+index; going through one Pinecone() keeps a single connection pool per process
+instead of one per module.
+"""
+
+import os
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+from pinecone import Pinecone
+
+load_dotenv()
+
+_PC: Optional[Pinecone] = None
+_INDEXES: Dict[str, Any] = {}
+
+
+def get_pinecone() -> Pinecone:
+    global _PC
+    if _PC is None:
+        api_key = os.getenv("PINECONE_API_KEY")
+        if not api_key:
+            raise ValueError("Missing PINECONE_API_KEY.")
+        _PC = Pinecone(api_key=api_key)
+    return _PC
+
+
+def get_index(name: Optional[str] = None):
+    """Return a cached Index handle (defaults to $PINECONE_INDEX)."""
+    name = name or os.getenv("PINECONE_INDEX")
+    if not name:
+        raise ValueError("Missing PINECONE_INDEX.")
+    if name not in _INDEXES:
+        _INDEXES[name] = get_pinecone().Index(name)
+    return _INDEXES[name]
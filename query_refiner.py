@@ -1,11 +1,12 @@
-import os
 import json
+from functools import lru_cache
 from pathlib import Path
-from dotenv import load_dotenv
-from openai import OpenAI
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+import orjson
+
+from openai_client import get_client
+
+client = get_client()
 
 # --- Load controlled vocab ---
 DICT_PATH = Path("metadata_dictionary.json")
@@ -138,6 +139,10 @@ Return STRICT JSON ONLY (no markdown, no commentary) matching this schema:
 }}
 """.strip()
 
+# Reduce prompt bloat: 120 samples is unnecessary and increases formatting failures.
+# Built once so every call sends byte-identical instructions (eligible for prompt caching).
+SYSTEM_PROMPT = _build_system_prompt(", ".join(DIAGNOSES[:30]), ", ".join(PROCEDURES[:30]))
+
 def _empty_payload_for(prompt: str, search_text: str) -> dict:
     # safest possible payload that won't nuke your filters
     return {
@@ -243,30 +248,49 @@ def refine_query(user_prompt: str):
     if not user_prompt.strip():
         return ""
 
-    search_text = build_search_text(user_prompt)
+    # Re-runs of the same case (tweaks, reloads) skip the model; the cache holds
+    # serialized payloads so every caller gets its own copy
+    try:
+        return orjson.loads(_refine_cached(" ".join(user_prompt.split())))
+    except _FallbackPayload as fb:
+        return fb.payload
+
+
+class _FallbackPayload(Exception):
+    """Raised through _refine_cached so lru_cache never stores a fallback payload."""
 
-    # Reduce prompt bloat: 120 is unnecessary and increases formatting failures
-    diag_sample = ", ".join(DIAGNOSES[:30])
-    proc_sample = ", ".join(PROCEDURES[:30])
-    system_prompt = _build_system_prompt(diag_sample, proc_sample)
+    def __init__(self, payload: dict):
+        super().__init__("query refiner fell back to the empty payload")
+        self.payload = payload
+
+
+@lru_cache(maxsize=1024)
+def _refine_cached(user_prompt: str) -> bytes:
+    # Only validated payloads are memoized; a bad/unparseable reply is retried next time
+    return orjson.dumps(_refine_uncached(user_prompt))
+
+
+def _refine_uncached(user_prompt: str) -> dict:
+    search_text = build_search_text(user_prompt)
 
     resp = client.chat.completions.create(
         model="gpt-4o-mini",
         messages=[
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": user_prompt.strip()},
         ],
         temperature=0.0,
         max_tokens=220,
+        extra_body={"prompt_cache_key": "caseprep-query-refiner-v1"},
     )
 
     raw = resp.choices[0].message.content.strip()
 
     try:
-        payload = json.loads(raw)
+        payload = orjson.loads(raw)
     except Exception:
         # If JSON parse fails, return safe payload instead of killing retrieval
-        return _empty_payload_for(user_prompt, search_text)
+        raise _FallbackPayload(_empty_payload_for(user_prompt, search_text))
 
     payload = coerce_payload(payload, search_text, user_prompt)
 
@@ -277,7 +301,8 @@ def refine_query(user_prompt: str):
     # If still invalid, return safe payload (do NOT return a string error)
     # Optional: print/log errors + raw for debugging
     # print("Refiner invalid:", errors, "raw:", raw)
-    return _empty_payload_for(user_prompt, search_text)
+    raise _FallbackPayload(_empty_payload_for(user_prompt, search_text))
+
 def payload_to_csv_line(p: dict) -> str:
     fields = []
     fields += p.get("specialties", [])
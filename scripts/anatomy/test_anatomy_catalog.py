@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Unit tests for anatomy_gpt.Catalog (indexing, summaries, compact/selected JSON).
+
+Makes no API calls.
+
+Run: python3 scripts/anatomy/test_anatomy_catalog.py
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+
+import anatomy_gpt  # noqa: E402
+from anatomy_gpt import SELECTED_JSON_CACHE_SIZE, SUMMARY_MAX_CHARS, Catalog  # noqa: E402
+
+ITEMS = [
+    {
+        "id": "kocher_langenbeck",
+        "name": "Kocher-Langenbeck",
+        "aliases": ["KL", "posterior acetabular", "a", "b", "c", "d"],
+        "meta": {"region": "pelvis", "anatomic_area": "acetabulum", "joint": "hip"},
+        "text": "Posterior approach to the acetabulum. " * 200,
+    },
+    {
+        "id": "smith_petersen",
+        "name": "Smith-Petersen",
+        "aliases": ["anterior hip"],
+        "meta": {"region": "hip"},
+        "text": "Anterior interval between sartorius and TFL.",
+    },
+    {"name": "no id entry", "text": "ignored by by_id"},
+]
+
+
+def _ok(name: str, cond: bool, detail: str = "") -> bool:
+    if cond:
+        print(f"PASS: {name}")
+        return True
+    print(f"FAIL: {name} {detail}")
+    return False
+
+
+def test_index_and_list_behaviour() -> bool:
+    cat = Catalog(list(ITEMS))
+    ok = (
+        set(cat.by_id) == {"kocher_langenbeck", "smith_petersen"}
+        and cat.ids == frozenset(cat.by_id)
+        and len(cat) == 3
+        and list(cat) == ITEMS
+    )
+    return _ok("by_id / ids / len / iter", ok)
+
+
+def test_summaries() -> bool:
+    cat = Catalog(list(ITEMS))
+    long_summary, short_summary = cat.summaries[0], cat.summaries[1]
+    ok = (
+        len(cat.summaries) == len(ITEMS)
+        and short_summary == ITEMS[1]["text"]
+        and ITEMS[0]["text"].startswith(long_summary)
+        and len(long_summary) < len(ITEMS[0]["text"])
+        and (anatomy_gpt._ENC is not None or len(long_summary) == SUMMARY_MAX_CHARS)
+        and "summary" not in ITEMS[0]
+    )
+    return _ok("summaries truncated, items untouched", ok, repr(long_summary[:40]))
+
+
+def test_compact_json() -> bool:
+    cat = Catalog(list(ITEMS))
+    rows = json.loads(cat.compact_json)
+    first = rows[0]
+    ok = (
+        len(rows) == 3
+        and first["aliases"] == ITEMS[0]["aliases"][:5]
+        and first["region"] == "pelvis"
+        and first["joint"] == "hip"
+        and first["summary"] == cat.summaries[0]
+        and "text" not in first
+        and cat.compact(50) == cat.compact_json[:50]
+    )
+    return _ok("compact JSON rows + max_chars slice", ok)
+
+
+def test_selected_json() -> bool:
+    cat = Catalog(list(ITEMS))
+    s = cat.selected_json(("smith_petersen", "missing", "kocher_langenbeck"))
+    picked = json.loads(s)
+    ok = (
+        [p["id"] for p in picked] == ["smith_petersen", "kocher_langenbeck"]
+        and picked[1] == ITEMS[0]
+        and cat.selected_json(("smith_petersen", "missing", "kocher_langenbeck")) is s
+        and json.loads(cat.selected_json(())) == []
+    )
+    return _ok("selected_json order, unknown ids, memoized", ok)
+
+
+def test_selected_json_cache_bounded() -> bool:
+    cat = Catalog(list(ITEMS))
+    for i in range(SELECTED_JSON_CACHE_SIZE + 10):
+        cat.selected_json((f"id{i}",))
+    return _ok("selected_json cache bounded", len(cat._selected) <= SELECTED_JSON_CACHE_SIZE, str(len(cat._selected)))
+
+
+def test_from_jsonl() -> bool:
+    with tempfile.TemporaryDirectory() as d:
+        a, b = Path(d) / "a.jsonl", Path(d) / "b.jsonl"
+        a.write_text(json.dumps(ITEMS[0]) + "\n\n", encoding="utf-8")
+        b.write_text(json.dumps(ITEMS[1]) + "\n", encoding="utf-8")
+        cat = Catalog.from_jsonl(str(a), str(b))
+    return _ok("from_jsonl concatenates files", [x["id"] for x in cat] == ["kocher_langenbeck", "smith_petersen"])
+
+
+def main() -> int:
+    print("=== anatomy_gpt.Catalog ===\n")
+    tests = [
+        test_index_and_list_behaviour,
+        test_summaries,
+        test_compact_json,
+        test_selected_json,
+        test_selected_json_cache_bounded,
+        test_from_jsonl,
+    ]
+    passed = sum(1 for t in tests if t())
+    failed = len(tests) - passed
+    print(f"\n=== RESULTS: {passed} passed, {failed} failed ===")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -84,13 +84,14 @@ def test_v1_module_import_isolation() -> bool:
 
 
 def test_v1_legacy_top_level_fields() -> bool:
+    from anatomy_gpt import Catalog
     from caseprep.config import CasePrepConfig
     from caseprep.engines import v1_legacy
 
     async def _run():
         return await v1_legacy.run_caseprep_v1(
             "THA tomorrow",
-            catalog=[],
+            catalog=Catalog([]),
             openai_client=None,
         )
 
@@ -113,10 +114,11 @@ def test_v1_survives_missing_curated_store() -> bool:
     with patch.object(store, "CERTIFIED_PAYLOADS_PATH", fake_path):
         store.reset_store_cache()
         store._load_store()
+        from anatomy_gpt import Catalog
         from caseprep.engines import v1_legacy
 
         async def _run():
-            return await v1_legacy.run_caseprep_v1("test case", catalog=[], openai_client=None)
+            return await v1_legacy.run_caseprep_v1("test case", catalog=Catalog([]), openai_client=None)
 
         try:
             result = asyncio.run(_run())
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Unit tests for gpt_refiner._prepare_snippets (score margin, near-dup, token limits).
+
+Makes no API calls, but importing gpt_refiner needs OPENAI_API_KEY set.
+
+Run: python3 scripts/anatomy/test_refiner_prepare_snippets.py
+"""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+
+import gpt_refiner  # noqa: E402
+from gpt_refiner import (  # noqa: E402
+    PER_SNIP_TOKENS,
+    _prepare_snippets,
+    _truncate_tokens,
+)
+
+
+def _ok(name: str, cond: bool, detail: str = "") -> bool:
+    if cond:
+        print(f"PASS: {name}")
+        return True
+    print(f"FAIL: {name} {detail}")
+    return False
+
+
+def _words(prefix: str, n: int) -> str:
+    return " ".join(f"{prefix}{i}" for i in range(n))
+
+
+MARGIN = 0.12
+
+
+def _scored_snips():
+    best = 0.9
+    return [
+        {"text": "Femoral nerve runs lateral to the artery", "score": best},
+        {"text": "Obturator nerve exits through the obturator canal", "score": best - MARGIN / 2},
+        {"text": "Median nerve passes through the carpal tunnel", "score": best - MARGIN * 2},
+    ]
+
+
+def test_score_margin_zero_keeps_all() -> bool:
+    with patch.object(gpt_refiner, "SNIP_SCORE_MARGIN", 0.0):
+        out = _prepare_snippets(_scored_snips(), 2000)
+    return _ok("margin 0 keeps every scored hit", len(out) == 3, str(out))
+
+
+def test_score_margin_drops_trailing_hits() -> bool:
+    with patch.object(gpt_refiner, "SNIP_SCORE_MARGIN", MARGIN):
+        out = _prepare_snippets(_scored_snips(), 2000)
+    ok = len(out) == 2 and not any("carpal tunnel" in s for s in out)
+    return _ok("score margin drops trailing hits", ok, str(out))
+
+
+def test_unscored_snippets_are_kept() -> bool:
+    snips = [
+        {"text": "Femoral nerve runs lateral to the artery", "score": 0.9},
+        {"text": "Median nerve passes through the carpal tunnel"},
+        "Plain string snippet about the sciatic nerve",
+    ]
+    with patch.object(gpt_refiner, "SNIP_SCORE_MARGIN", MARGIN):
+        out = _prepare_snippets(snips, 2000)
+    return _ok("unscored dicts and strings bypass the margin", len(out) == 3, str(out))
+
+
+def test_source_is_appended() -> bool:
+    out = _prepare_snippets([{"text": "Femoral nerve runs lateral to the artery", "source": "Millers"}], 2000)
+    return _ok("source tag appended", out == ["Femoral nerve runs lateral to the artery [Source: Millers]"], str(out))
+
+
+def test_near_duplicates_dropped() -> bool:
+    base = _words("w", 40)
+    snips = [base, base + " extra", _words("other", 40)]
+    out = _prepare_snippets(snips, 2000)
+    ok = len(out) == 2 and out[0] == base and out[1].startswith("other0")
+    return _ok("shingle near-duplicates dropped", ok, str([s[:20] for s in out]))
+
+
+def test_short_and_unknown_dropped() -> bool:
+    out = _prepare_snippets(["tiny", None, 42, {"text": ""}], 2000)
+    return _ok("short/empty/unknown snippets dropped", out == [], str(out))
+
+
+def test_per_snippet_truncation() -> bool:
+    long_text = _words("tok", 3000)
+    out = _prepare_snippets([long_text], 100_000)
+    ok = (
+        len(out) == 1
+        and len(out[0]) < len(long_text)
+        # already within the cap, so truncating again is a no-op
+        and _truncate_tokens(out[0], PER_SNIP_TOKENS)[0] == out[0]
+    )
+    return _ok("per-snippet token truncation", ok, str(len(out[0]) if out else out))
+
+
+def test_overall_budget() -> bool:
+    snips = [_words(f"s{k}x", 300) for k in range(30)]
+    budget = 3 * (PER_SNIP_TOKENS + 1)
+    out = _prepare_snippets(snips, budget)
+    total = sum(_truncate_tokens(s, PER_SNIP_TOKENS)[1] + 1 for s in out)
+    ok = 1 <= len(out) <= 3 and total <= budget
+    return _ok("overall token budget enforced", ok, f"{len(out)} snippets, {total} tokens")
+
+
+def test_first_snippet_always_kept() -> bool:
+    out = _prepare_snippets([_words("big", 3000)], 5)
+    return _ok("first snippet kept even over budget", len(out) == 1, str(len(out)))
+
+
+def main() -> int:
+    print(f"=== gpt_refiner._prepare_snippets (tiktoken={'yes' if gpt_refiner._ENC else 'no'}) ===\n")
+    tests = [
+        test_score_margin_zero_keeps_all,
+        test_score_margin_drops_trailing_hits,
+        test_unscored_snippets_are_kept,
+        test_source_is_appended,
+        test_near_duplicates_dropped,
+        test_short_and_unknown_dropped,
+        test_per_snippet_truncation,
+        test_overall_budget,
+        test_first_snippet_always_kept,
+    ]
+    passed = sum(1 for t in tests if t())
+    failed = len(tests) - passed
+    print(f"\n=== RESULTS: {passed} passed, {failed} failed ===")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
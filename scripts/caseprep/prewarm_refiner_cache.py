@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Pre-warm the gpt_refiner cache for upcoming cases through the OpenAI Batch API.
+
+Each case prompt runs refine_query + Pinecone retrieval live, then all pimp
+refinements go out as one batch (half price, minutes-to-hours turnaround).
+Results land in the same cache /case-prep reads, so the real request is a hit
+as long as retrieval returns the same snippets.
+
+Input: text file with one case prompt per line (blank lines / # comments skipped).
+
+Run: python3 scripts/caseprep/prewarm_refiner_cache.py cases.txt [--timeout-hours 4]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from pathlib import Path
+from typing import Any, List, Tuple
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.chdir(BASE_DIR)  # query_refiner and the refiner cache use repo-relative paths
+
+from gpt_refiner import refine_case_snippets_batch  # noqa: E402
+from query_refiner import refine_query  # noqa: E402
+from vector_search import get_case_snippets, prefetch_raw_snippets  # noqa: E402
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("cases", type=Path, help="file with one case prompt per line")
+    ap.add_argument("--timeout-hours", type=float, default=4.0, help="cancel the batch and refine live after this")
+    args = ap.parse_args()
+
+    prompts = [
+        line.strip()
+        for line in args.cases.read_text(encoding="utf-8").splitlines()
+        if line.strip() and not line.lstrip().startswith("#")
+    ]
+    if not prompts:
+        print(f"No case prompts in {args.cases}")
+        return 1
+
+    jobs: List[Tuple[str, List[Any]]] = []
+    for prompt in prompts:
+        # Same retrieval as /case-prep v1, so the cache keys line up
+        snippets = get_case_snippets(refine_query(prompt), extra_hits=prefetch_raw_snippets(prompt))
+        print(f"🔎 {len(snippets):>3} snippets  {prompt}")
+        jobs.append((prompt, snippets))
+
+    results = refine_case_snippets_batch(jobs, timeout_s=args.timeout_hours * 3600)
+
+    for prompt, result in zip(prompts, results):
+        print(f"✅ {len(result['pimpQuestions']):>3} Qs  {len(result['otherUsefulFacts']):>3} facts  {prompt}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
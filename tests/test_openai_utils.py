@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import unittest
+from types import SimpleNamespace
+
+from openai_batch import _chunk_lines
+from openai_utils import retry_delay, token_batches
+
+
+class _WordEnc:
+    """Stand-in tiktoken encoding: one token per whitespace-separated word."""
+
+    def encode_ordinary_batch(self, texts):
+        return [t.split() for t in texts]
+
+
+def _flatten(batches):
+    return [t for _, texts in batches for t in texts]
+
+
+class TokenBatchesTests(unittest.TestCase):
+    def test_item_cap_and_start_indices(self):
+        texts = [f"t{i}" for i in range(10)]
+        batches = token_batches(texts, max_items=4, max_tokens=10_000, enc=_WordEnc())
+        self.assertEqual([len(b) for _, b in batches], [4, 4, 2])
+        self.assertEqual([s for s, _ in batches], [0, 4, 8])
+        self.assertEqual(_flatten(batches), texts)
+
+    def test_token_cap_splits_batches(self):
+        texts = ["a " * 6, "b " * 6, "c " * 3, "d " * 9]
+        batches = token_batches(texts, max_items=100, max_tokens=10, enc=_WordEnc())
+        self.assertEqual([s for s, _ in batches], [0, 1, 3])
+        self.assertEqual(_flatten(batches), texts)
+
+    def test_text_over_the_cap_is_sent_alone(self):
+        texts = ["small", "huge " * 50, "small too"]
+        batches = token_batches(texts, max_items=100, max_tokens=10, enc=_WordEnc())
+        self.assertEqual([b for _, b in batches], [["small"], ["huge " * 50], ["small too"]])
+
+    def test_char_estimate_without_encoder(self):
+        texts = ["x" * 29, "y" * 29, "z" * 29]  # 29 // 3 + 1 = 10 estimated tokens each
+        batches = token_batches(texts, max_items=100, max_tokens=20)
+        self.assertEqual([len(b) for _, b in batches], [2, 1])
+
+    def test_no_texts_no_batches(self):
+        self.assertEqual(token_batches([], max_items=4, max_tokens=10), [])
+
+
+class RetryDelayTests(unittest.TestCase):
+    def test_honours_retry_after_header(self):
+        e = SimpleNamespace(response=SimpleNamespace(headers={"retry-after": "7"}))
+        self.assertEqual(retry_delay(e, 0), 7.0)
+
+    def test_backs_off_without_header(self):
+        e = SimpleNamespace(response=SimpleNamespace(headers={}))
+        d = retry_delay(e, 3)
+        self.assertTrue(8 <= d < 9, d)
+        d = retry_delay(Exception(), 0)
+        self.assertTrue(1 <= d < 2, d)
+
+
+class BatchChunkLinesTests(unittest.TestCase):
+    def test_split_by_request_count(self):
+        chunks = list(_chunk_lines([b"x"] * 7, max_requests=3))
+        self.assertEqual([n for _, n in chunks], [3, 3, 1])
+
+    def test_split_by_bytes(self):
+        chunks = list(_chunk_lines([b"aa", b"bb", b"cc"], max_bytes=6))
+        self.assertEqual(chunks, [(b"aa\nbb", 2), (b"cc", 1)])
+
+    def test_no_lines_no_chunks(self):
+        self.assertEqual(list(_chunk_lines([])), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,28 +1,30 @@
 import os
 import json
+import math
+import operator
 import re
+from array import array
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
-from pinecone import Pinecone
-from openai import OpenAI
 from typing import List, Dict, Any, Optional
 
 from query_refiner import refine_query  # make sure it exists
+from pinecone_client import get_index
+from openai_client import get_client
 
 
 # ── ENV & CLIENTS ─────────────────────────────────────────────
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_PROJECT_ID = os.getenv("OPENAI_PROJECT_ID")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX")
 
 if not all([OPENAI_API_KEY, PINECONE_API_KEY, PINECONE_INDEX_NAME]):
     raise ValueError("❌ Missing OPENAI_API_KEY, PINECONE_API_KEY, or PINECONE_INDEX")
 
-client = OpenAI(api_key=OPENAI_API_KEY, project=OPENAI_PROJECT_ID)
-pc = Pinecone(api_key=PINECONE_API_KEY)
-index = pc.Index(PINECONE_INDEX_NAME)
+client = get_client()
+index = get_index(PINECONE_INDEX_NAME)
 
 EMBED_MODEL = "text-embedding-3-small"
 from typing import List, Dict, Any, Optional, Tuple
@@ -36,8 +38,15 @@ NO_FILTER_MIN_UNIQUE = 10   # only run no_filter if we have <= 10 unique hits
 TARGET_RESULTS = 40   # stop early when we have enough good unique snippets
 
 
+@lru_cache(maxsize=256)
+def _embed_cached(txt: str) -> array:
+    # float32 storage: 6 KB per vector instead of ~50 KB as a tuple of Python floats
+    return array("f", client.embeddings.create(model=EMBED_MODEL, input=txt).data[0].embedding)
+
+
 def embed_text(txt: str) -> List[float]:
-    return client.embeddings.create(model=EMBED_MODEL, input=txt).data[0].embedding
+    # Repeat cases (retries, reloads, popular procedures) reuse the query embedding
+    return list(_embed_cached(txt))
 
 
 def payload_to_embedding_text(p: dict) -> str:
@@ -72,20 +81,20 @@ def payload_to_embedding_text(p: dict) -> str:
 def _sig_for_item(text: str) -> str:
     """Stable signature for dedupe (better than first N words)."""
     norm = " ".join((text or "").lower().split())
-    return hashlib.md5(norm.encode("utf-8")).hexdigest()
+    return hashlib.blake2b(norm.encode("utf-8"), digest_size=16).hexdigest()
 
 
-def _score_matches(matches: List[dict]) -> List[dict]:
+def _score_matches(matches: List[dict], min_score: float = MIN_SCORE, keep_values: bool = False) -> List[dict]:
     out: List[dict] = []
     for m in matches:
         score = float(m.get("score", 0) or 0)
         meta = m.get("metadata") or {}
         text = (meta.get("text") or "").replace("\n", " ").strip()
 
-        if score < MIN_SCORE or not text:
+        if score < min_score or not text:
             continue
 
-        out.append({
+        item = {
             "id": m.get("id"),  # if Pinecone provides it
             "text": text,
             "source": meta.get("source"),
@@ -95,7 +104,10 @@ def _score_matches(matches: List[dict]) -> List[dict]:
             "diagnoses": meta.get("diagnoses") or [],
             "procedures": meta.get("procedures") or [],
             "score": score,
-        })
+        }
+        if keep_values:
+            item["values"] = array("f", m.get("values") or [])
+        out.append(item)
     return out
 
 
@@ -103,11 +115,9 @@ def _dedupe_keep_best(items: List[dict], limit: int = 200) -> List[dict]:
     best: Dict[str, dict] = {}
 
     for it in items:
-        # prefer ID if available
-        if it.get("id"):
-            key = f"id:{it['id']}"
-        else:
-            key = f"sig:{_sig_for_item(it.get('text', ''))}"
+        # Key on normalized text, not ID: the same card is often ingested under
+        # several IDs (per-deck prefixes), and each copy would otherwise reach GPT.
+        key = _sig_for_item(it.get("text", ""))
 
         if key not in best or it.get("score", 0) > best[key].get("score", 0):
             best[key] = it
@@ -169,8 +179,73 @@ def _build_and_filter(refined: dict,
     return {"$and": clauses}
 
 
-def get_case_snippets(refined_query: dict) -> List[dict]:
+def _matches_filter(item: dict, filt: Optional[Dict[str, Any]]) -> bool:
+    """Local evaluation of a _build_and_filter filter ($in / $and) against a hit's metadata."""
+    if not filt:
+        return True
+    if "$and" in filt:
+        return all(_matches_filter(item, clause) for clause in filt["$and"])
+    for field, cond in filt.items():
+        allowed = cond.get("$in") or []
+        value = item.get(field)
+        values = value if isinstance(value, list) else [value]
+        if not any(v in allowed for v in values):
+            return False
+    return True
+
+
+def _cosine(a, b) -> float:
+    dot = sum(map(operator.mul, a, b))
+    norm = math.sqrt(sum(map(operator.mul, a, a)) * sum(map(operator.mul, b, b)))
+    return dot / norm if norm else 0.0
+
+
+def _rescore_extra_hits(vec: List[float], hits: List[dict], filt: Optional[Dict[str, Any]]) -> List[dict]:
+    """
+    Put prefetched raw-prompt hits on the ladder's footing: same metadata filter
+    as the loosest rung that ran, and scored against the refined vector so the
+    merge (and gpt_refiner's SNIP_SCORE_MARGIN) compares like with like.
+    """
+    out: List[dict] = []
+    for h in hits:
+        values = h.get("values")
+        if not values or not _matches_filter(h, filt):
+            continue
+        score = _cosine(vec, values)
+        if score < MIN_SCORE:
+            continue
+        item = {k: v for k, v in h.items() if k != "values"}
+        item["score"] = score
+        out.append(item)
+    return out
+
+
+def prefetch_raw_snippets(raw_prompt: str) -> List[dict]:
+    """
+    Unfiltered query on the raw case prompt. Needs no refine_query output, so
+    callers run it while the refiner is in flight and pass the hits to
+    get_case_snippets(extra_hits=...), which filters and re-scores them.
+    Hits carry their vectors ("values"); scores are only provisional.
+    """
+    resp = index.query(
+        vector=embed_text(raw_prompt),
+        top_k=TOP_K_STRICT,
+        include_metadata=True,
+        include_values=True,
+    )
+    # No MIN_SCORE cut yet: what counts is the score against the refined vector
+    return _score_matches(resp.get("matches", []) or [], min_score=-1.0, keep_values=True)
+
+
+def get_case_snippets(refined_query: dict, extra_hits: Optional[List[dict]] = None) -> List[dict]:
+    """
+    Filter-ladder retrieval on the refined query. extra_hits (from
+    prefetch_raw_snippets) are held to the loosest filter the ladder ran and
+    re-scored against the refined vector before joining the final merge; they
+    never count toward the ladder's early-stop or no-filter decisions.
+    """
     vec = embed_text(payload_to_embedding_text(refined_query))
+    extra = list(extra_hits or [])
 
     ladder: List[Tuple[str, Optional[Dict[str, Any]], int]] = []
 
@@ -204,7 +279,7 @@ def get_case_snippets(refined_query: dict) -> List[dict]:
         print(f"   → {len(merged)} unique merged hits so far")
 
         if len(merged) >= TARGET_RESULTS:
-            return merged
+            return _dedupe_keep_best(all_hits + _rescore_extra_hits(vec, extra, filt), limit=200)
 
     # ✅ Only run no_filter if we still have <= 10 unique results
     if len(merged) <= NO_FILTER_MIN_UNIQUE:
@@ -212,11 +287,13 @@ def get_case_snippets(refined_query: dict) -> List[dict]:
         hits = _pinecone_query(vec, None, top_k=TOP_K_BROAD)
         print(f"   → {len(hits)} raw hits (>= {MIN_SCORE})")
         all_hits.extend(hits)
+        loosest = None
 
     else:
         print(f"\n🛑 Skipping NO FILTER fallback (already {len(merged)} unique hits > {NO_FILTER_MIN_UNIQUE}).")
+        loosest = ladder[-1][1]
 
-    return _dedupe_keep_best(all_hits, limit=200)
+    return _dedupe_keep_best(all_hits + _rescore_extra_hits(vec, extra, loosest), limit=200)
 
 # ── INTERACTIVE TEST ──────────────────────────────────────────
 if __name__ == "__main__":